@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------------------------
+# Project: PKUYouth Webserver v2
+# File: bench_cache_format.py
+# Created Date: 2020-08-03
+# Author: Xinghong Zhong
+# ---------------------------------------
+# Copyright (c) 2020 PKUYouth
+
+import sys
+sys.path.append('../')
+
+import os
+import time
+import random
+import tempfile
+from updater.utils import jgz_dump, jgz_load, jl_dump, jl_iter, JL_CODECS
+
+ARTICLES = 5000
+WORDS = "北大 青年 学生 校园 采访 记者 未来 燕园 the of and to in".split()
+
+
+def make_adclist(n):
+    adclist = []
+    for i in range(n):
+        appmsgid = "{:0>10d}".format(2650000000 - i // 4)
+        adclist.append({
+            "digest": ' '.join(random.choice(WORDS) for _ in range(30)),
+            "content": ' '.join(random.choice(WORDS) for _ in range(1500)),
+            "appmsgid": appmsgid,
+            "title": ' '.join(random.choice(WORDS) for _ in range(8)),
+            "cover_url": "https://mmbiz.qpic.cn/mmbiz_jpg/%032x/0?wx_fmt=jpeg" % i,
+            "content_url": "http://mp.weixin.qq.com/s?__biz=MzA3NzAzMDEyNg==&mid=%s&idx=%d&sn=%032x"
+                            % (appmsgid, i % 4 + 1, i),
+            "like_num": random.randint(0, 1000),
+            "read_num": random.randint(0, 100000),
+            "masssend_time": 1596000000 - i * 3600,
+            "idx": str(i % 4 + 1),
+            "sn": "%032x" % i,
+        })
+    return adclist
+
+
+def bench(name, dump, load, adclist, file):
+
+    t0 = time.perf_counter()
+    dump(adclist, file)
+    t1 = time.perf_counter()
+    n = sum(1 for _ in load(file))
+    t2 = time.perf_counter()
+
+    assert n == len(adclist)
+
+    print("%-16s %10.3f %10.3f %12d" % (name, t1 - t0, t2 - t1, os.path.getsize(file)))
+
+
+def main():
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else ARTICLES
+    adclist = make_adclist(n)
+
+    print("%d articles" % n)
+    print("%-16s %10s %10s %12s" % ("format", "write(s)", "read(s)", "size(B)"))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+
+        file = os.path.join(tmpdir, "adclist.json.gz")
+        bench("json.gz", jgz_dump, jgz_load, adclist, file)
+
+        for codec in JL_CODECS:
+            file = os.path.join(tmpdir, "adclist.jsonl.%s" % codec)
+            dump = lambda obj, file: jl_dump(obj, file, codec)
+            bench("jsonl/%s" % codec, dump, jl_iter, adclist, file)
+
+
+if __name__ == "__main__":
+    main()
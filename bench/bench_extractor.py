@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------------------------
+# Project: PKUYouth Webserver v2
+# File: bench_extractor.py
+# Created Date: 2020-08-03
+# Author: Xinghong Zhong
+# ---------------------------------------
+# Copyright (c) 2020 PKUYouth
+
+import sys
+sys.path.append('../')
+
+import os
+import time
+from updater.extractor import extract_article, extract_article_tree
+from updater.archive import HTMLArchive
+from updater.const import CACHE_DIR
+
+ROUNDS = 5
+MAX_ARCHIVED_PAGES = 500
+
+
+def load_pages():
+
+    # pages saved by test/test_client.py test_download_static, then pages
+    # in the archive written by the updater
+
+    pages = []
+
+    for name in sorted(os.listdir(CACHE_DIR)):
+        if name.endswith(".html"):
+            with open(os.path.join(CACHE_DIR, name), 'rb') as fp:
+                pages.append(fp.read())
+
+    archive_dir = os.path.join(CACHE_DIR, "archive/")
+
+    if os.path.exists(archive_dir):
+        archive = HTMLArchive(archive_dir)
+        for _, html in archive:
+            if len(pages) >= MAX_ARCHIVED_PAGES:
+                break
+            pages.append(html)
+        archive.close()
+
+    return pages
+
+
+def bench(func, pages, rounds):
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for html in pages:
+            func(html)
+    t1 = time.perf_counter()
+    return rounds * len(pages) / (t1 - t0)
+
+
+def main():
+
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else ROUNDS
+    pages = load_pages()
+
+    if len(pages) == 0:
+        print("no sample pages in %s, run test/test_client.py test_download_static "
+              "or the updater first" % CACHE_DIR)
+        return
+
+    mismatched = sum( 1 for html in pages
+                      if extract_article(html) != extract_article_tree(html) )
+
+    print("%d pages, %.1f MB, %d results differ"
+            % (len(pages), sum(map(len, pages)) / 1024 / 1024, mismatched))
+    print("%-12s %12s" % ("method", "pages/s"))
+
+    for name, func in [ ("tree", extract_article_tree), ("extractor", extract_article) ]:
+        print("%-12s %12.1f" % (name, bench(func, pages, rounds)))
+
+
+if __name__ == "__main__":
+    main()
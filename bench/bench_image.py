@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------------------------
+# Project: PKUYouth Webserver v2
+# File: bench_image.py
+# Created Date: 2020-08-03
+# Author: Xinghong Zhong
+# ---------------------------------------
+# Copyright (c) 2020 PKUYouth
+
+import sys
+sys.path.append('../')
+
+import time
+from io import BytesIO
+from PIL import Image
+from updater.image import compress_sm_cover, compress_bg_cover, open_cover,\
+    make_covers, im2bytes
+
+ROUNDS = 20
+
+
+def make_sample(size):
+    noise = Image.effect_noise(size, 48).convert('RGB')
+    gradient = Image.linear_gradient('L').resize(size).convert('RGB')
+    im = Image.blend(noise, gradient, 0.6)
+    return im2bytes(im, format='jpeg', quality=90)
+
+
+def cdn_variant(data, width=640):
+    """ what the CDN serves for a /640 cover URL """
+    im = Image.open(BytesIO(data))
+    ow, oh = im.size
+    if ow > width:
+        im = im.resize((width, int(width / ow * oh)), Image.BICUBIC)
+    return im2bytes(im.convert('RGB'), format='jpeg', quality=90)
+
+
+def full_decode(data):
+    im = Image.open(BytesIO(data)).convert('RGB')
+    return compress_sm_cover(im), compress_bg_cover(im)
+
+
+def draft_decode(data):
+    return make_covers(open_cover(data))
+
+
+def bench(func, data):
+    t0 = time.perf_counter()
+    for _ in range(ROUNDS):
+        func(data)
+    return (time.perf_counter() - t0) / ROUNDS * 1000
+
+
+def main():
+
+    if len(sys.argv) > 1:
+        samples = []
+        for file in sys.argv[1:]:
+            with open(file, 'rb') as fp:
+                samples.append((file, fp.read()))
+    else:
+        samples = [ ("%dx%d" % size, make_sample(size))
+                    for size in [(900, 500), (1080, 1920), (2000, 1500), (4000, 3000)] ]
+
+    print("%-20s %10s %10s %8s %10s %10s %10s" % ("sample", "full(ms)", "draft(ms)",
+            "speedup", "bytes", "640(B)", "640(ms)"))
+
+    for name, data in samples:
+        variant = cdn_variant(data)
+        t1 = bench(full_decode, data)
+        t2 = bench(draft_decode, data)
+        t3 = bench(draft_decode, variant)
+        print("%-20s %10.2f %10.2f %7.1fx %10d %10d %10.2f"
+                % (name, t1, t2, t1 / t2, len(data), len(variant), t3))
+
+
+if __name__ == "__main__":
+    main()
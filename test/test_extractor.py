@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------------------------
+# Project: PKUYouth Webserver v2
+# File: test_extractor.py
+# Created Date: 2020-08-03
+# Author: Xinghong Zhong
+# ---------------------------------------
+# Copyright (c) 2020 PKUYouth
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../'))
+
+from lxml import etree
+from updater.extractor import extract_article
+
+
+def extract_article_old(html):
+    """ the extraction used before updater.extractor """
+
+    tree = etree.HTML(html)
+
+    digest = tree.xpath('//head/meta[@name="description"]/@content')
+
+    if len(digest) == 0:
+        return None, None
+
+    digest = digest[0]
+    content = tree.xpath('//div[@id="js_content"]//text()')
+    content = ' '.join(s.strip() for s in content if len(s) > 0 and not s.isspace())
+
+    return digest, content
+
+
+def page(body, head='<meta charset="utf-8">', digest="摘要 &amp; more"):
+    return ('<!DOCTYPE html><html><head>%s<meta name="description" content="%s">'
+            '</head><body><div class="rich_media">%s</div><script>var a = "<div>";'
+            '</script></body></html>' % (head, digest, body))
+
+
+PAGES = {
+    "plain": page('<div id="js_content"><p>正文 a</p>\n  <p> b </p></div><p>c</p>'),
+    "nested": page('<div id="js_content"><div><div>a</div></div><p>b</p></div><p>c</p>'),
+    "comment": page('<div id="js_content"><p>a</p><!-- </div> --><p>b</p></div><p>c</p>'),
+    "comment_open": page('<div id="js_content"><p>a</p><!-- <div> --><p>b</p></div><p>c</p>'),
+    "script": page('<div id="js_content"><p>a</p><script>s = "</div>";</script>'
+                   '<p>b</p></div><p>c</p>'),
+    "style": page('<div id="js_content"><style>p { } /* </div> */</style><p>a</p></div>'
+                  '<p>c</p>'),
+    "cdata": page('<div id="js_content"><p>a</p><![CDATA[ </div> ]]><p>b</p></div><p>c</p>'),
+    "unclosed": page('<div id="js_content"><p>a</p><div><p>b</p>'),
+    "uppercase": page('<DIV ID="js_content"><P>a</P><DIV>b</DIV></DIV><p>c</p>'),
+    "no_content": page('<p>a</p>'),
+    "no_digest": '<html><head></head><body><div id="js_content">a</div></body></html>',
+    "gbk": page('<div id="js_content"><p>中文正文</p></div>',
+                head='<meta http-equiv="Content-Type" content="text/html; charset=gbk">',
+                digest="中文摘要"),
+}
+
+
+def encode(name, html):
+    return html.encode('gbk' if name == "gbk" else 'utf-8')
+
+
+def test_same_as_old_extraction():
+    for name, html in PAGES.items():
+        html = encode(name, html)
+        assert extract_article(html) == extract_article_old(html), name
+
+
+def test_comment_in_content():
+    html = encode("comment", PAGES["comment"])
+    assert extract_article(html) == ("摘要 & more", "a b")
+
+
+def test_non_utf8_page():
+    html = encode("gbk", PAGES["gbk"])
+    assert extract_article(html) == ("中文摘要", "中文正文")
+
+
+if __name__ == "__main__":
+    test_same_as_old_extraction()
+    test_comment_in_content()
+    test_non_utf8_page()
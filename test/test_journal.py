@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------------------------
+# Project: PKUYouth Webserver v2
+# File: test_journal.py
+# Created Date: 2020-08-03
+# Author: Xinghong Zhong
+# ---------------------------------------
+# Copyright (c) 2020 PKUYouth
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../'))
+
+import tempfile
+from updater.journal import ProgressJournal, RUN, STAGE_LIST, STAGE_CONTENT,\
+    STAGE_DATABASE, STAGE_STATIC
+
+
+def count_lines(file):
+    with open(file, 'r', encoding='utf-8') as fp:
+        return sum( 1 for _ in fp )
+
+
+def test_mark_and_reload():
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        file = os.path.join(tmpdir, "progress.journal")
+
+        journal = ProgressJournal(file)
+        journal.mark(RUN, RUN, STAGE_LIST)
+        journal.mark("0000001000", 1, STAGE_CONTENT)
+        journal.mark("0000001000", "1", STAGE_CONTENT)
+        journal.close()
+
+        journal = ProgressJournal(file)
+
+        assert len(journal) == 2
+        assert journal.is_done(RUN, RUN, STAGE_LIST)
+        assert journal.is_done("0000001000", 1, STAGE_CONTENT)
+        assert not journal.is_done("0000001000", 1, STAGE_STATIC)
+        assert not journal.is_done("0000001000", 2, STAGE_CONTENT)
+
+        journal.close()
+
+
+def test_torn_last_line():
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        file = os.path.join(tmpdir, "progress.journal")
+
+        with open(file, 'w', encoding='utf-8') as fp:
+            fp.write("0000001000 1 content\n0000001000 1 stat")
+
+        journal = ProgressJournal(file)
+
+        assert len(journal) == 1
+        assert journal.is_done("0000001000", 1, STAGE_CONTENT)
+        assert not journal.is_done("0000001000", 1, "stat")
+
+        journal.close()
+
+
+def test_compact():
+
+    stages = (STAGE_CONTENT, STAGE_DATABASE, STAGE_STATIC)
+    articles = 5000
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        file = os.path.join(tmpdir, "progress.journal")
+
+        journal = ProgressJournal(file)
+
+        for stage in stages:
+            for i in range(articles):
+                journal.mark("%010d" % i, 1, stage)
+
+        assert len(journal) == articles * len(stages)
+        assert journal.lines <= 2 * articles
+        assert count_lines(file) == journal.lines
+
+        journal.close()
+
+        journal = ProgressJournal(file)
+
+        assert len(journal) == articles * len(stages)
+        assert all( journal.is_done("%010d" % i, 1, stage)
+                    for i in range(articles) for stage in stages )
+
+        journal.close()
+
+
+def test_reset():
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        file = os.path.join(tmpdir, "progress.journal")
+
+        journal = ProgressJournal(file)
+        journal.mark(RUN, RUN, STAGE_LIST)
+        journal.reset()
+        journal.mark("0000001000", 1, STAGE_CONTENT)
+        journal.close()
+
+        journal = ProgressJournal(file)
+
+        assert len(journal) == 1
+        assert not journal.is_done(RUN, RUN, STAGE_LIST)
+
+        journal.close()
+
+
+if __name__ == "__main__":
+    test_mark_and_reload()
+    test_torn_last_line()
+    test_compact()
+    test_reset()
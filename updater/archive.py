@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------------------------
+# Project: PKUYouth Webserver v2
+# File: archive.py
+# Created Date: 2020-08-03
+# Author: Xinghong Zhong
+# ---------------------------------------
+# Copyright (c) 2020 PKUYouth
+
+import os
+import mmap
+import zlib
+import threading
+from ._internal import mkdir
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SEGMENT_SIZE = 256 * 1024 * 1024
+
+
+class HTMLArchive(object):
+
+    # Raw article pages, each compressed on its own (zstd, or zlib without
+    # zstandard) and appended to segment-NNNNN.dat files of at most
+    # SEGMENT_SIZE bytes. index.jsonl gets one [key, segment, offset, length,
+    # codec] line per page after its bytes are written, the last line of a
+    # key wins. Segments are read through mmap.
+
+    def __init__(self, directory, segment_size=SEGMENT_SIZE):
+        self._dir = directory
+        self._segment_size = segment_size
+        self._lock = threading.Lock()
+        self._index = {}
+        self._maps = {}
+
+        mkdir(directory)
+
+        index_file = os.path.join(directory, "index.jsonl")
+
+        if os.path.exists(index_file):
+            with open(index_file, 'r', encoding='utf-8') as fp:
+                for line in fp:
+                    try:
+                        key, segment, offset, length, codec = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line
+                    self._index[key] = (segment, offset, length, codec)
+
+        segments = [ int(name[8:13]) for name in os.listdir(directory)
+                     if name.startswith("segment-") ]
+
+        self._segment = max(segments, default=0)
+        self._fp = open(self._segment_path(self._segment), 'ab')
+        self._ifp = open(index_file, 'a', encoding='utf-8')
+
+        self._codec = "zstd" if zstandard is not None else "zlib"
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def _segment_path(self, segment):
+        return os.path.join(self._dir, "segment-%05d.dat" % segment)
+
+    def _compress(self, data):
+        if self._codec == "zstd":
+            return zstandard.ZstdCompressor(level=10).compress(data)
+        return zlib.compress(data, 6)
+
+    @staticmethod
+    def _decompress(data, codec):
+        if codec == "zstd":
+            if zstandard is None:
+                raise RuntimeError("zstandard is required to read this archive")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    def put(self, key, html):
+
+        data = self._compress(html)
+
+        with self._lock:
+            if self._fp.tell() > 0 and self._fp.tell() + len(data) > self._segment_size:
+                self._fp.close()
+                self._segment += 1
+                self._fp = open(self._segment_path(self._segment), 'ab')
+
+            offset = self._fp.tell()
+            self._fp.write(data)
+            self._fp.flush()
+
+            entry = (self._segment, offset, len(data), self._codec)
+            self._ifp.write(json.dumps([key, *entry]) + '\n')
+            self._ifp.flush()
+
+            self._index[key] = entry
+
+    def _view(self, segment, end):
+        with self._lock:
+            mm = self._maps.get(segment)
+            if mm is None or len(mm) < end:
+                if mm is not None:
+                    mm.close()
+                with open(self._segment_path(segment), 'rb') as fp:
+                    mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[segment] = mm
+            return mm
+
+    def get(self, key):
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        segment, offset, length, codec = entry
+        mm = self._view(segment, offset + length)
+        return self._decompress(mm[offset : offset + length], codec)
+
+    def keys(self):
+        return list(self._index.keys())
+
+    def __iter__(self):
+        """ (key, html) pairs in file order """
+        for key, _ in sorted(self._index.items(), key=lambda kv: kv[1][:2]):
+            yield key, self.get(key)
+
+    def close(self):
+        for mm in self._maps.values():
+            mm.close()
+        self._maps.clear()
+        self._fp.close()
+        self._ifp.close()
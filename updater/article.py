@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------------------------
+# Project: PKUYouth Webserver v2
+# File: article.py
+# Created Date: 2020-08-03
+# Author: Xinghong Zhong
+# ---------------------------------------
+# Copyright (c) 2020 PKUYouth
+
+class Article(object):
+
+    # Fields in cache row order. Rows written before the content stage stop
+    # after masssend_time; rows from the content stage also carry digest and
+    # content, which is how `fetched` survives a round trip through the cache.
+
+    __slots__ = (
+        'appmsgid',
+        'idx',
+        'sn',
+        'title',
+        'cover_url',
+        'content_url',
+        'like_num',
+        'read_num',
+        'masssend_time',
+        'digest',
+        'content',
+        'fetched',
+    )
+
+    LIST_FIELDS = 9
+
+    def __init__(self, appmsgid, idx, sn, title, cover_url, content_url, like_num,
+                 read_num, masssend_time, digest=None, content=None, fetched=False):
+        self.appmsgid = appmsgid
+        self.idx = idx
+        self.sn = sn
+        self.title = title
+        self.cover_url = cover_url
+        self.content_url = content_url
+        self.like_num = like_num
+        self.read_num = read_num
+        self.masssend_time = masssend_time
+        self.digest = digest
+        self.content = content
+        self.fetched = fetched
+
+    def __repr__(self):
+        return "Article(%s, %s)" % (self.appmsgid, self.idx)
+
+    @property
+    def key(self):
+        return (self.appmsgid, self.idx)
+
+    @property
+    def counters(self):
+        return (self.like_num, self.read_num)
+
+    def has_content(self):
+        return self.digest is not None or self.content is not None
+
+    def set_content(self, digest, content):
+        self.digest = digest
+        self.content = content
+        self.fetched = True
+
+    def to_row(self):
+        row = [ self.appmsgid, self.idx, self.sn, self.title, self.cover_url,
+                self.content_url, self.like_num, self.read_num, self.masssend_time ]
+        if self.fetched:
+            row += [ self.digest, self.content ]
+        return row
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row, fetched=len(row) > cls.LIST_FIELDS)
+
+    def insert_params(self):
+        """ parameters of db.INSERT_ARTICLE_SQL """
+        return (self.appmsgid.lstrip('0'), int(self.idx), self.sn, self.title,
+                self.digest, self.content, self.cover_url, self.content_url,
+                self.like_num, self.read_num, self.masssend_time)
+
+    def stats_params(self):
+        """ (appmsgid, idx, like_num, read_num) for db.update_article_stats """
+        return (self.appmsgid.lstrip('0'), int(self.idx), self.like_num, self.read_num)
@@ -10,20 +10,56 @@
 
 import os
 import time
-from functools import wraps
+import queue
+import argparse
+import threading
+import multiprocessing
+from functools import wraps, partial
+from itertools import chain
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
 from io import BytesIO
 from PIL import Image
 import pymysql
-from lxml import etree
 from urllib.parse import urlparse, parse_qsl
 from .config import UpdaterConfig
 from .client import MPWXClient, QiniuClient
-from .image import compress_sm_cover, compress_bg_cover, im2bytes
-from .utils import jgz_dump, jgz_load
+from .httpcache import HTTPCache
+from .retry import RetryPolicy
+from .transport import Transport
+from .archive import HTMLArchive
+from .covercache import CoverCache, settings_key
+from .extractor import extract_article
+from .image import encode_covers, read_cover, CoverTooLarge, ENCODER_SETTINGS,\
+    BG_COVER_WIDTH, COVER_MAX_BYTES, COVER_MAX_PIXELS, available_formats
+from .db import load_article_stats, load_max_article_key, insert_articles,\
+    update_article_stats, update_article_contents, load_article_covers
+from .schedule import StatsScheduler
+from .state import SyncState
+from .manifest import UploadManifest
+from .pipeline import Pipeline
+from .article import Article
+from .journal import ProgressJournal, RUN, STAGE_LIST, STAGE_CONTENT, STAGE_DATABASE,\
+    STAGE_STATIC
+from .utils import jl_dump, jl_iter, imap_ordered
 from .const import CACHE_DIR
 
-ADLIST_JSON = os.path.join(CACHE_DIR, "adlist.json.gz")
-ADCLIST_JSON = os.path.join(CACHE_DIR, "adclist.json.gz")
+ADLIST_JSONL = os.path.join(CACHE_DIR, "adlist.jsonl.z")
+ADCLIST_JSONL = os.path.join(CACHE_DIR, "adclist.jsonl.z")
+STATS_SCHEDULE = os.path.join(CACHE_DIR, "stats_schedule.gz")
+SYNC_STATE = os.path.join(CACHE_DIR, "sync_state.gz")
+UPLOAD_MANIFEST = os.path.join(CACHE_DIR, "upload_manifest.gz")
+PROGRESS_JOURNAL = os.path.join(CACHE_DIR, "progress.journal")
+HTTP_CACHE_DIR = os.path.join(CACHE_DIR, "http/")
+HTML_ARCHIVE_DIR = os.path.join(CACHE_DIR, "archive/")
+COVER_CACHE_DIR = os.path.join(CACHE_DIR, "covers/")
+
+# cover URLs of the most recent articles whose downloads are shared
+SHARED_COVERS = 256
+
+# articles whose covers may be downloading, encoding or uploading at once,
+# per download and encode worker
+COVERS_IN_FLIGHT_PER_WORKER = 2
 
 def log(func):
     @wraps(func)
@@ -89,233 +125,759 @@ def task_mpwx_login(client):
     client.dump_session()
 
 
-@log
-def task_download_articles_list(client):
+def parse_sent_list(slist):
 
-    count = 7
-    begin = 0
-    total = -1
+    for i, msg in enumerate(slist):
+        if msg['type'] != 9:
+            continue
+
+        masssend_time = msg['sent_info']['time']
+
+        for m in msg['appmsg_info']:
+
+            if m['is_deleted']:
+                continue
+            if 'comment_id' not in m and 'copyright_type' not in m:
+                continue
+
+            idx = None
+            sn = None
 
-    adlist = []
+            for k, v in parse_qsl(urlparse(m['content_url']).query):
+                if k in ("idx", "itemidx"):
+                    idx = v
+                if k in ("sn", "sign"):
+                    sn = v
 
-    while total == -1 or begin <= total:
+            assert idx is not None and sn is not None
 
-        print("[MPWX] GET newmasssendpage %d/%d)" % (begin, total))
+            ad = Article(
+                appmsgid="{:0>10d}".format(m['appmsgid']),
+                idx=idx,
+                sn=sn,
+                title=m['title'],
+                cover_url=m['cover'],
+                content_url=m['content_url'],
+                like_num=m['like_num'],
+                read_num=m['read_num'],
+                masssend_time=masssend_time,
+            )
+
+            yield i, ad
+
+
+def rebuild_watermark(conn, state):
+
+    appmsgid, idx = load_max_article_key(conn)
+
+    state.set_watermark(appmsgid, idx)
+    state.dump()
+
+    print("[STATE] Rebuilt watermark (%s, %s)" % (appmsgid, idx))
+
+
+def crawl_articles_list(client, state, count=7, workers=1, refresh_days=None,
+                        scheduler=None):
+
+    total = -1
 
+    def _fetch(begin):
+        print("[MPWX] GET newmasssendpage %d/%d" % (begin, total))
         r = client.newmasssendpage(count, begin)
-        rjson = r.json()
+        return r.json()['sent_list']
 
-        total = rjson['total_count']
-        slist = rjson['sent_list']
+    # the first page tells how many messages there are, so the offsets of
+    # all the remaining pages are known before any of them is requested
 
-        for msg in slist:
-            if msg['type'] != 9:
-                continue
+    print("[MPWX] GET newmasssendpage %d/%d" % (0, total))
+
+    r = client.newmasssendpage(count, 0)
+    rjson = r.json()
+
+    total = rjson['total_count']
+
+    def _pages():
+
+        yield 0, rjson['sent_list']
+
+        fetched = { 0 }
+        begins = list(range(count, total + 1, count))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+
+            if refresh_days is None:
+                print("[MPWX] Full stats sweep")
+                yield from zip(begins, executor.map(_fetch, begins))
+                return
+
+            # stop once a page lies entirely behind both the newest article
+            # in the database and the statistics refresh horizon
 
-            masssend_time = msg['sent_info']['time']
+            max_appmsgid = state.appmsgid
+            horizon = int(time.time()) - refresh_days * 86400
 
-            for m in msg['appmsg_info']:
+            print("[MPWX] Incremental crawl (appmsgid > %s or masssend_time >= %d)"
+                    % (max_appmsgid, horizon))
 
-                if m['is_deleted']:
-                    continue
-                if 'comment_id' not in m and 'copyright_type' not in m:
-                    continue
+            def _is_exhausted(slist):
+                ads = [ ad for _, ad in parse_sent_list(slist) ]
+                if len(ads) == 0:
+                    return False
+                ad = ads[-1]
+                return ad.appmsgid <= max_appmsgid and ad.masssend_time < horizon
 
-                ad = {
-                    "appmsgid": "{:0>10d}".format(m['appmsgid']),
-                    "title": m['title'],
-                    "cover_url": m['cover'],
-                    "content_url": m['content_url'],
-                    "like_num": m['like_num'],
-                    "read_num": m['read_num'],
-                    "masssend_time": masssend_time,
-                }
+            exhausted = _is_exhausted(rjson['sent_list'])
 
-                for k, v in parse_qsl(urlparse(m['content_url']).query):
-                    if k in ("idx", "itemidx"):
-                        ad['idx'] = v
-                    if k in ("sn", "sign"):
-                        ad['sn'] = v
+            while len(begins) > 0 and not exhausted:
+                wave, begins = begins[:workers], begins[workers:]
+                for begin, slist in zip(wave, executor.map(_fetch, wave)):
+                    fetched.add(begin)
+                    yield begin, slist
+                    exhausted = _is_exhausted(slist)
+                    if exhausted:
+                        break
 
-                assert 'idx' in ad and 'sn' in ad
+            # older articles are only revisited when the scheduler says so
 
-                adlist.append(ad)
+            if scheduler is not None:
+                print("[MPWX] Stats scheduler: %s" % scheduler.summary())
+                due = [ begin for begin in scheduler.due_pages(total, count)
+                        if begin not in fetched ]
+                yield from zip(due, executor.map(_fetch, due))
 
-        begin += count
+    keys = set()
+    now = int(time.time())
+
+    for begin, slist in _pages():
+        for i, ad in parse_sent_list(slist):
+
+            # page boundaries move if a message is sent during the crawl
+            key = ad.key
+            if key in keys:
+                continue
+            keys.add(key)
+
+            if scheduler is not None:
+                scheduler.update(ad, total - 1 - (begin + i), now)
+
+            yield ad
 
-    jgz_dump(adlist, ADLIST_JSON)
     client.dump_session()
 
+    if scheduler is not None:
+        scheduler.dump()
+
+
+@log
+def task_download_articles_list(client, state, count=7, workers=1, refresh_days=None,
+                                scheduler=None, journal=None):
+
+    if journal is not None and journal.is_done(RUN, RUN, STAGE_LIST) \
+            and os.path.exists(ADLIST_JSONL):
+        print("[JOURNAL] Reuse articles list")
+        return
+
+    adlist = crawl_articles_list(client, state, count, workers, refresh_days, scheduler)
+
+    n = jl_dump(( ad.to_row() for ad in adlist ), ADLIST_JSONL)
+
+    print("[MPWX] %d articles listed" % n)
+
+    if journal is not None:
+        journal.mark(RUN, RUN, STAGE_LIST)
+
+
+def archive_key(appmsgid, idx):
+    return "%s_%s" % (appmsgid, idx)
+
+
+def fetch_article_contents(client, ads, workers=1, archive=None):
+
+    def _fetch(ad):
+        print("[MPWX] GET article_content (%s, %s)" % (ad.appmsgid, ad.idx))
+        r = client.article_content(ad.content_url)
+        return r.content
+
+    # pages are fetched by the pool while the caller's thread parses them in order
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+
+        for ad, html in imap_ordered(executor, _fetch, ads, workers * 2):
+
+            if archive is not None:
+                archive.put(archive_key(ad.appmsgid, ad.idx), html)
+
+            digest, content = extract_article(html)
+
+            if digest is None:
+                print("[MPWX] Abnormal article %s" % ad.content_url)
+
+                # verification and frequency limit pages come with HTTP 200,
+                # the next run must ask for the article again
+                if client.http_cache is not None:
+                    client.http_cache.discard(ad.content_url)
+
+            ad.set_content(digest, content)
+
+            yield ad
+
 
 @log
-def task_download_article_content(client, conn):
+def task_download_article_content(client, state, workers=1, journal=None, archive=None):
 
-    adlist = jgz_load(ADLIST_JSON)
+    max_appmsgid = state.appmsgid
 
     lastid = '9999999999'
+    targets = []
+
+    for ad in map(Article.from_row, jl_iter(ADLIST_JSONL)):
 
-    for ad in adlist:
-        appmsgid = ad['appmsgid']
+        appmsgid = ad.appmsgid
         assert appmsgid <= lastid, (appmsgid, lastid)
         lastid = appmsgid
 
-    sql = 'SELECT MAX(`appmsgid`) FROM `article` WHERE LENGTH(`appmsgid`) = 10'
+        if appmsgid > max_appmsgid:
+            targets.append(ad)
 
-    with conn.cursor() as cur:
-        cur.execute(sql)
-        max_appmsgid = cur.fetchone()[0].zfill(10)
+    # contents fetched by an interrupted run are kept in ADCLIST_JSONL and
+    # reused when the journal says they are complete
 
-    adclist = []
+    done = {}
 
-    for ad in adlist:
+    if journal is not None and len(journal) > 0 and os.path.exists(ADCLIST_JSONL):
+        for adc in map(Article.from_row, jl_iter(ADCLIST_JSONL)):
+            if journal.is_done(adc.appmsgid, adc.idx, STAGE_CONTENT):
+                done[adc.key] = adc
+        print("[JOURNAL] Reuse %d article contents" % len(done))
 
-        appmsgid = ad['appmsgid']
-        idx = ad['idx']
+    todo = [ ad for ad in targets if ad.key not in done ]
 
-        if appmsgid <= max_appmsgid:
-            break
+    try:
+        for adc in fetch_article_contents(client, todo, workers, archive):
+            done[adc.key] = adc
+            if journal is not None:
+                journal.mark(adc.appmsgid, adc.idx, STAGE_CONTENT)
 
-        print("[MPWX] GET article_content (%s, %s)" % (appmsgid, idx))
+    finally:
+        adclist = [ done[ad.key] for ad in targets if ad.key in done ]
+        jl_dump(( adc.to_row() for adc in adclist ), ADCLIST_JSONL)
 
-        url = ad['content_url']
 
-        r = client.article_content(url)
-        tree = etree.HTML(r.content)
+def update_database(conn, state, ads, batch_size=500, journal=None):
 
-        digest = tree.xpath('//head/meta[@name="description"]/@content')
+    # ads that went through the content stage are inserted
+    # unless already stored, the others only have their counters refreshed.
+    # Whether an article is new, and whether its counters moved, is decided
+    # against one snapshot of the table rather than per-row queries
 
-        if len(digest) == 0:
-            print("[MPWX] Abnormal article %s" % url)
-            digest = None
-            content = None
-        else:
-            digest = digest[0]
-            content = tree.xpath('//div[@id="js_content"]//text()')
-            content = ' '.join(s.strip() for s in content if len(s) > 0 and not s.isspace())
+    print("[MYSQL] Load article stats")
 
-        adclist.append({
-            'digest': digest,
-            'content': content,
-            **ad,
-        })
+    stats = load_article_stats(conn)
 
-    jgz_dump(adclist, ADCLIST_JSON)
+    print("[MYSQL] %d stored articles" % len(stats))
 
+    new_rows = []
+    old_rows = []
 
-@log
-def task_update_database(conn):
+    crawled = 0
+    changed = 0
+    inserted = 0
+    updated = 0
+    watermark = None
+
+    def _mark(rows):
+        if journal is not None:
+            for row in rows:
+                journal.mark(row[0].zfill(10), row[1], STAGE_DATABASE)
 
-    cur = conn.cursor()
+    for ad in ads:
 
-    adlist = jgz_load(ADLIST_JSON)
-    adclist = jgz_load(ADCLIST_JSON)
+        key = ad.key
+        counters = ad.counters
+
+        if journal is not None and journal.is_done(ad.appmsgid, ad.idx, STAGE_DATABASE):
+            continue
 
-    admap = { (ad['appmsgid'], ad['idx']): ad for ad in adlist }
+        if ad.fetched and key not in stats:
 
-    print("[MYSQL] Insert new articles")
+            if not ad.has_content():
+                continue
 
-    for ad in adclist:
+            new_rows.append(ad.insert_params())
+            stats[key] = counters
 
-        appmsgid = ad['appmsgid']
-        idx = ad['idx']
+            if watermark is None or (ad.appmsgid, int(ad.idx)) > watermark:
+                watermark = (ad.appmsgid, int(ad.idx))
 
-        key = (appmsgid, idx)
-        admap.pop(key)
+            if len(new_rows) >= batch_size:
+                inserted += insert_articles(conn, new_rows, batch_size)
+                _mark(new_rows)
+                new_rows = []
 
-        if ad['digest'] is None and ad['content'] is None:
             continue
 
-        appmsgid = appmsgid.lstrip('0')
-        idx = int(idx)
-        sn = ad['sn']
-        title = ad['title']
-        digest = ad['digest']
-        content = ad['content']
-        cover_url = ad['cover_url']
-        content_url = ad['content_url']
-        like_num = ad['like_num']
-        read_num = ad['read_num']
-        masssend_time = ad['masssend_time']
-
-        sql = (
-            'INSERT INTO `article` '
-            '(`appmsgid`,`idx`,`sn`,`title`,`digest`,`content`,`cover_url`,'
-            ' `content_url`,`like_num`,`read_num`,`masssend_time`) '
-            'VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)'
-        )
+        if key not in stats:
+            continue
 
-        data = (appmsgid, idx, sn, title, digest, content, cover_url,
-                content_url, like_num, read_num, masssend_time)
-        cur.execute(sql, data)
+        crawled += 1
 
-    print("[MYSQL] update old articles")
+        if stats[key] == counters:
+            continue
 
-    for ad in admap.values():
+        old_rows.append(ad.stats_params())
+        stats[key] = counters
+        changed += 1
 
-        appmsgid = ad['appmsgid'].lstrip('0')
-        idx = int(ad['idx'])
-        like_num = ad['like_num']
-        read_num = ad['read_num']
+        if len(old_rows) >= batch_size:
+            updated += update_article_stats(conn, old_rows, batch_size)
+            _mark(old_rows)
+            old_rows = []
 
-        sql = (
-            'UPDATE `article` '
-            'SET `like_num` = %s,'
-            '    `read_num` = %s '
-            'WHERE `appmsgid` = %s AND `idx` = %s '
-        )
+    inserted += insert_articles(conn, new_rows, batch_size)
+    _mark(new_rows)
 
-        data = (like_num, read_num, appmsgid, idx)
-        cur.execute(sql, data)
+    updated += update_article_stats(conn, old_rows, batch_size)
+    _mark(old_rows)
 
-    cur.close()
-    conn.commit()
+    print("[MYSQL] Inserted %d rows" % inserted)
+    print("[MYSQL] Updated %d rows, %d of %d crawled changed"
+            % (updated, changed, crawled))
+
+    if watermark is not None:
+        appmsgid, idx = watermark
+        if appmsgid > state.appmsgid:
+            state.set_watermark(appmsgid, str(idx))
+            state.dump()
+            print("[STATE] Watermark (%s, %s)" % (appmsgid, idx))
 
 
 @log
-def task_update_static(client, qclient):
+def task_update_database(conn, state, batch_size=500, journal=None):
 
-    adclist = jgz_load(ADCLIST_JSON)
+    # only the new articles are held in memory, the full list is streamed
 
-    for ad in adclist:
+    adclist = list(map(Article.from_row, jl_iter(ADCLIST_JSONL)))
 
-        if ad['digest'] is None and ad['content'] is None:
-            continue
+    keys = { ad.key for ad in adclist }
+
+    ads = chain(adclist, ( ad for ad in map(Article.from_row, jl_iter(ADLIST_JSONL))
+                           if ad.key not in keys ))
+
+    update_database(conn, state, ads, batch_size, journal)
+
+
+def cover_keys(ad, formats=("jpeg",)):
+    """ keys of the covers of ad in the order of encode_covers """
+    key = "%s%s" % (ad.appmsgid, ad.idx)
+    keys = []
+    for fmt in formats:
+        keys.append("pkuyouth/sm_cover/%s.%s" % (key, fmt))
+        keys.append("pkuyouth/bg_cover/%s.%s" % (key, fmt))
+    return keys
+
+
+def reconcile_manifest(qclient, manifest):
+
+    keys = manifest.keys()
+    hashes = qclient.stat_many(keys)
+    dropped = 0
+
+    for key in keys:
+        if hashes.get(key) != manifest.get(key)['hash']:
+            print("[QINIU] Stale manifest entry %s" % key)
+            manifest.remove(key)
+            dropped += 1
 
-        appmsgid = ad['appmsgid']
-        idx = ad['idx']
-        key = "%s%s" % (appmsgid, idx)
+    manifest.dump()
 
-        print("[MPWX] update_static (%s, %s)" % (appmsgid, idx))
+    print("[QINIU] Reconciled %d manifest entries, %d dropped" % (len(keys), dropped))
 
-        url = ad['cover_url']
-        r = client.article_cover(url)
 
-        buf = BytesIO(r.content)
-        im = Image.open(buf).convert('RGB')
+def update_static(client, qclient, ads, workers=1, image_workers=None, manifest=None,
+                  journal=None, max_bytes=COVER_MAX_BYTES, max_pixels=COVER_MAX_PIXELS,
+                  formats=("jpeg",), cover_cache=None):
 
-        sim = compress_sm_cover(im)
-        bim = compress_bg_cover(im)
+    # with no format there is no cover to upload, and no upload to finish
+    # an article with
+    if len(formats) == 0:
+        raise ValueError("no cover format to encode")
 
-        smdata = im2bytes(sim, format='jpeg', quality=50)
-        bgdata = im2bytes(bim, format='jpeg', quality=60)
+    sources = {}
+    owners = {}
+    remaining = {}
+    lock = threading.Lock()
 
-        smkey = "pkuyouth/sm_cover/%s.jpeg" % key
-        bgkey = "pkuyouth/bg_cover/%s.jpeg" % key
+    skey = settings_key(ENCODER_SETTINGS, formats)
 
-        print("[QINIU] PUT %s" % smkey)
-        qclient.put_data(smdata, smkey)
+    # a slot is taken for each article before its download is submitted and
+    # given back once all of its covers are uploaded, failed or skipped, so
+    # originals and encoded covers cannot pile up in the executor queues
+    # when encoding or uploading is slower than downloading
+    in_flight = threading.Semaphore(COVERS_IN_FLIGHT_PER_WORKER
+                                    * (workers + (image_workers or os.cpu_count())))
+    stopped = threading.Event()
 
-        print("[QINIU] PUT %s" % bgkey)
-        qclient.put_data(bgdata, bgkey)
+    def _todo():
+        for ad in ads:
+
+            if not ad.has_content():
+                continue
+
+            if journal is not None and journal.is_done(ad.appmsgid, ad.idx, STAGE_STATIC):
+                continue
+
+            if manifest is not None and all(
+                    manifest.is_fresh(key, ad.cover_url, ENCODER_SETTINGS)
+                    for key in cover_keys(ad, formats)):
+                print("[QINIU] Skip (%s, %s)" % (ad.appmsgid, ad.idx))
+                continue
+
+            yield ad
+
+    def _download(ad):
+        print("[MPWX] update_static (%s, %s)" % (ad.appmsgid, ad.idx))
+
+        if cover_cache is not None:
+            data = cover_cache.get_original(ad.cover_url, BG_COVER_WIDTH)
+            if data is not None:
+                return data
+
+        r = client.article_cover(ad.cover_url, BG_COVER_WIDTH, stream=True)
+
+        length = r.headers.get("content-length")
+        if length is not None:
+            length = int(length)
+
+        try:
+            data = read_cover(r.iter_content(64 * 1024), length, max_bytes, max_pixels)
+        except CoverTooLarge as e:
+            print("[MPWX] Skip oversized cover of (%s, %s): %s" % (ad.appmsgid, ad.idx, e))
+            return None
+        finally:
+            r.close()
+
+        if cover_cache is not None:
+            cover_cache.put_original(ad.cover_url, BG_COVER_WIDTH, data)
+
+        return data
+
+    def _encoded():
+
+        # covers are downloaded by threads and encoded by worker processes.
+        # A feeder thread submits downloads as ads arrive, each download
+        # chains its encode, and each encoded cover comes back through a
+        # queue and is yielded to the uploader as soon as it is ready
+
+        results = queue.Queue()
+
+        # encode workers are started from the callbacks of download threads,
+        # forking there would copy the locks held by the other threads
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            mp_context = multiprocessing.get_context("forkserver")
+        else:
+            mp_context = multiprocessing.get_context("spawn")
+
+        with ProcessPoolExecutor(max_workers=image_workers, mp_context=mp_context) as ppool,\
+                ThreadPoolExecutor(max_workers=workers) as dpool:
+
+            # one download and encode per cover URL, shared by the articles
+            # of a mass send which reuse a cover
+            covers_of = OrderedDict()
+
+            def _resolve(cf, f):
+                if f.exception() is not None:
+                    cf.set_exception(f.exception())
+                else:
+                    cf.set_result(f.result())
+
+            def _on_encoded(cf, data, f):
+                if cover_cache is not None and f.exception() is None:
+                    try:
+                        cover_cache.put_encoded(data, skey, f.result())
+                    except OSError as e:
+                        print("[CACHE] Failed to keep encoded covers: %s" % e)
+                _resolve(cf, f)
+
+            def _on_downloaded(cf, f):
+                if f.exception() is not None or f.result() is None:
+                    _resolve(cf, f)
+                    return
+
+                data = f.result()
+
+                # the same cover, from any article, encoded with the same
+                # settings before
+                if cover_cache is not None:
+                    covers = cover_cache.get_encoded(data, skey)
+                    if covers is not None:
+                        cf.set_result(covers)
+                        return
+
+                e = ppool.submit(encode_covers, data, formats)
+                e.add_done_callback(partial(_on_encoded, cf, data))
+
+            def _on_covers(ad, cf):
+                results.put(('cover', ad, cf))
+
+            def _feed():
+                n = 0
+                try:
+                    for ad in _todo():
+                        while not in_flight.acquire(timeout=1):
+                            if stopped.is_set():
+                                return
+                        cf = covers_of.get(ad.cover_url)
+                        if cf is None:
+                            cf = covers_of[ad.cover_url] = Future()
+                            if len(covers_of) > SHARED_COVERS:
+                                covers_of.popitem(last=False)
+                            f = dpool.submit(_download, ad)
+                            f.add_done_callback(partial(_on_downloaded, cf))
+                        cf.add_done_callback(partial(_on_covers, ad))
+                        n += 1
+                except BaseException as e:
+                    results.put(('end', n, e))
+                else:
+                    results.put(('end', n, None))
+
+            threading.Thread(target=_feed, daemon=True).start()
+
+            received = 0
+            total = None
+
+            try:
+                while total is None or received < total:
+
+                    item = results.get()
+
+                    if item[0] == 'end':
+                        _, total, e = item
+                        if e is not None:
+                            raise e
+                        continue
+
+                    _, ad, f = item
+                    received += 1
+
+                    if f.result() is None:
+                        in_flight.release()
+                        continue  # skipped download
+
+                    akey = ad.key
+                    covers = list(zip(f.result(), cover_keys(ad, formats)))
+
+                    with lock:
+                        remaining[akey] = len(covers)
+
+                    for data, key in covers:
+                        sources[key] = (ad.cover_url, qclient.etag(data))
+                        owners[key] = akey
+                        print("[QINIU] PUT %s" % key)
+                        yield data, key
+
+            finally:
+                stopped.set()
+
+    def _on_uploaded(key, e):
+
+        if e is not None:
+            print("[QINIU] Failed to PUT %s: %s" % (key, e))
+        elif manifest is not None:
+            manifest.add(key, *sources[key], ENCODER_SETTINGS)
+
+        akey = owners[key]
+
+        with lock:
+            remaining[akey] -= 1
+            if e is not None:
+                failed.add(akey)
+            finished = remaining[akey] == 0
+            succeeded = finished and akey not in failed
+
+        if finished:
+            in_flight.release()
+
+        if succeeded and journal is not None:
+            journal.mark(*akey, STAGE_STATIC)
+
+    failed = set()
+
+    try:
+        errors = qclient.put_many(_encoded(), workers, _on_uploaded)
+    finally:
+        if manifest is not None:
+            manifest.dump()
+        if cover_cache is not None:
+            cover_cache.dump()
+
+    failed_keys = [ key for key, e in errors.items() if e is not None ]
+
+    print("[QINIU] Uploaded %d/%d covers" % (len(errors) - len(failed_keys), len(errors)))
+
+    if len(failed_keys) > 0:
+        raise RuntimeError("[QINIU] %d uploads failed" % len(failed_keys))
+
+
+@log
+def task_update_static(client, qclient, workers=1, image_workers=None, manifest=None,
+                       journal=None, max_bytes=COVER_MAX_BYTES, max_pixels=COVER_MAX_PIXELS,
+                       formats=("jpeg",), cover_cache=None):
+
+    adclist = map(Article.from_row, jl_iter(ADCLIST_JSONL))
+
+    update_static(client, qclient, adclist, workers, image_workers, manifest, journal,
+                  max_bytes, max_pixels, formats, cover_cache)
+
+
+@log
+def task_pipeline(client, conn, qclient, state, config, scheduler=None, manifest=None,
+                  refresh_days=None, journal=None, archive=None, formats=("jpeg",),
+                  cover_cache=None):
+
+    # the batch tasks above chained through bounded queues instead of files:
+    # list pages stream into content fetching, which feeds both the database
+    # writer and the cover processing, so all stages run at the same time
+
+    pipeline = Pipeline(config.pipeline_queue_size)
+
+    listq = pipeline.queue()
+    dbq = pipeline.queue()
+    staticq = pipeline.queue()
+
+    max_appmsgid = state.appmsgid
+
+    def _list():
+        for ad in crawl_articles_list(client, state, config.list_page_size,
+                                      config.list_workers, refresh_days, scheduler):
+            pipeline.put(listq, ad)
+
+    def _content():
+
+        def _is_complete(ad):
+            return journal is not None \
+                and journal.is_done(ad.appmsgid, ad.idx, STAGE_DATABASE) \
+                and journal.is_done(ad.appmsgid, ad.idx, STAGE_STATIC)
+
+        def _targets():
+            for ad in pipeline.iterate(listq):
+                if ad.appmsgid > max_appmsgid and not _is_complete(ad):
+                    yield ad
+                else:
+                    pipeline.put(dbq, ad)
+
+        for adc in fetch_article_contents(client, _targets(), config.content_workers,
+                                          archive):
+            pipeline.put(dbq, adc)
+            if adc.has_content():
+                pipeline.put(staticq, adc)
+
+    def _database():
+        update_database(conn, state, pipeline.iterate(dbq), config.db_batch_size, journal)
+
+    def _static():
+        update_static(client, qclient, pipeline.iterate(staticq), config.static_workers,
+                      config.image_workers, manifest, journal, config.cover_max_bytes,
+                      config.cover_max_pixels, formats, cover_cache)
+
+    pipeline.stage("list", _list, outputs=[listq])
+    pipeline.stage("content", _content, outputs=[dbq, staticq])
+    pipeline.stage("database", _database)
+    pipeline.stage("static", _static)
+
+    pipeline.run()
+
+
+@log
+def task_regenerate_covers(client, qclient, conn, config, manifest=None, formats=("jpeg",),
+                           cover_cache=None):
+
+    # covers of every stored article, skipping those uploaded with the current
+    # settings already. With the cover cache, an encoder change needs no
+    # download from the image CDN at all
+
+    ads = [ Article(appmsgid, idx, None, None, cover_url, None, None, None, None,
+                    digest=digest)
+            for appmsgid, idx, cover_url, digest in load_article_covers(conn) ]
+
+    print("[DB] %d articles with covers" % len(ads))
+
+    update_static(client, qclient, ads, config.static_workers, config.image_workers,
+                  manifest, None, config.cover_max_bytes, config.cover_max_pixels,
+                  formats, cover_cache)
+
+
+@log
+def task_reextract(conn, archive, batch_size=500):
+
+    # digest and content of every archived page extracted again and written
+    # over the stored ones, without any request to mp.weixin.qq.com
+
+    def _rows():
+        for key, html in archive:
+            appmsgid, idx = key.split('_')
+            digest, content = extract_article(html)
+            if digest is None:
+                print("[ARCHIVE] Abnormal article (%s, %s)" % (appmsgid, idx))
+                continue
+            yield (digest, content, appmsgid.lstrip('0'), int(idx))
+
+    updated = update_article_contents(conn, _rows(), batch_size)
+
+    print("[DB] Re-extract %d archived articles, %d updated" % (len(archive), updated))
 
 
 def main():
 
+    parser = argparse.ArgumentParser(description="PKUYouth updater")
+    parser.add_argument("--full-sweep", action="store_true",
+                        help="refresh the statistics of every article in history")
+    parser.add_argument("--rebuild-watermark", action="store_true",
+                        help="recompute the sync watermark from the article table and exit")
+    parser.add_argument("--reconcile-manifest", action="store_true",
+                        help="check the upload manifest against the bucket before uploading")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip the work an interrupted run has already completed")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="stream articles through all stages at once instead of "
+                             "running the stages one after another")
+    parser.add_argument("--regenerate-covers", action="store_true",
+                        help="encode and upload the covers of all stored articles again "
+                             "where the encoder settings changed, then exit")
+    parser.add_argument("--reextract", action="store_true",
+                        help="extract the archived article pages again into the "
+                             "article table and exit")
+
+    args = parser.parse_args()
+
     config = UpdaterConfig()
 
+    http_cache = None
+
+    if config.http_cache_size > 0:
+        http_cache = HTTPCache(
+            directory=HTTP_CACHE_DIR,
+            max_size=config.http_cache_size * 1024 * 1024,
+            ttl=config.http_cache_ttl,
+        )
+
     client = MPWXClient(
         username=config.mpwx_username,
         password=config.mpwx_password,
+        http_cache=http_cache,
+        rate_limit={
+            "rate": config.request_rate,
+            "max_rate": config.max_request_rate,
+            "max_concurrency": config.max_request_concurrency,
+        },
+        timeout=(config.connect_timeout, config.read_timeout),
+        retry=RetryPolicy(config.retries, config.retry_backoff),
+        hedge_percentile=config.hedge_percentile,
+        hedge_min_samples=config.hedge_min_samples,
+        transport=Transport(
+            pool_size=config.pool_size,
+            pool_sizes=config.pool_sizes,
+            http2=config.http2,
+            dns_ttl=config.dns_cache_ttl,
+        ),
     )
 
     qclient = QiniuClient(
@@ -333,18 +895,115 @@ def main():
         charset=config.mysql_charset,
     )
 
+    archive = HTMLArchive(HTML_ARCHIVE_DIR) if config.html_archive else None
+
+    cover_cache = None
+
+    if config.cover_cache_size > 0:
+        cover_cache = CoverCache(COVER_CACHE_DIR, config.cover_cache_size * 1024 * 1024)
+
+    state = SyncState(SYNC_STATE)
+    manifest = UploadManifest(UPLOAD_MANIFEST)
+    journal = ProgressJournal(PROGRESS_JOURNAL)
+
+    if args.resume:
+        print("[JOURNAL] Resume with %d completed entries" % len(journal))
+    else:
+        journal.reset()
+
+    formats = available_formats(config.cover_formats)
+
+    for fmt in config.cover_formats:
+        if fmt not in formats:
+            print("[IMAGE] Pillow cannot write %s, skip %s covers" % (fmt, fmt))
+
     try:
+        if len(formats) == 0:
+            raise RuntimeError("no cover format in cover_formats can be written")
+
+        if args.reextract:
+            if archive is None:
+                raise RuntimeError("html_archive is disabled in config.ini")
+            task_reextract(conn, archive, config.db_batch_size)
+            return
+
+        if args.regenerate_covers:
+            task_regenerate_covers(client, qclient, conn, config, manifest, formats,
+                                   cover_cache)
+            return
+
+        if args.rebuild_watermark or state.appmsgid is None:
+            rebuild_watermark(conn, state)
+            if args.rebuild_watermark:
+                return
+
+        state.begin_run()
+
         task_mpwx_login(client)
-        task_download_articles_list(client)
-        task_download_article_content(client, conn)
-        task_update_database(conn)
-        task_update_static(client, qclient)
+
+        refresh_days = None if args.full_sweep else config.stats_refresh_days
+        scheduler = StatsScheduler(STATS_SCHEDULE) if config.stats_scheduler else None
+
+        if args.reconcile_manifest:
+            reconcile_manifest(qclient, manifest)
+
+        if args.pipeline:
+            task_pipeline(client, conn, qclient, state, config, scheduler, manifest,
+                          refresh_days, journal, archive, formats, cover_cache)
+
+        else:
+            task_download_articles_list(
+                client, state,
+                count=config.list_page_size,
+                workers=config.list_workers,
+                refresh_days=refresh_days,
+                scheduler=scheduler,
+                journal=journal,
+            )
+            task_download_article_content(client, state, config.content_workers,
+                                          journal, archive)
+            task_update_database(conn, state, config.db_batch_size, journal)
+            task_update_static(client, qclient, config.static_workers,
+                               config.image_workers, manifest, journal,
+                               config.cover_max_bytes, config.cover_max_pixels,
+                               formats, cover_cache)
+
+        for host, controller in client.rate_controllers.items():
+            print("[MPWX] Rate of %s: %s" % (host, controller.summary()))
+
+        for endpoint in client.latency.endpoints():
+            print("[MPWX] Latency of %s: %s" % (endpoint, client.latency.summary(endpoint)))
+
+        print("[MPWX] %d requests retried, %d hedged, %d answered first by the hedge"
+                % (client.retried, client.hedged, client.hedge_wins))
+
+        for line in client.transport.summary():
+            print("[HTTP] %s" % line)
+
+        if cover_cache is not None:
+            print("[CACHE] Covers %d hits, %d misses, %.1f MB"
+                    % (cover_cache.hits, cover_cache.misses, cover_cache.size / 1024 / 1024))
+
+        if http_cache is not None:
+            print("[HTTP] Cache %d hits, %d revalidated, %d misses, %.1f MB"
+                    % (http_cache.hits, http_cache.revalidated, http_cache.misses,
+                       http_cache.size / 1024 / 1024))
+
+        state.finish_run()
+        state.dump()
+
+        # a finished run leaves nothing to resume, so a later --resume
+        # crawls and writes everything again instead of reusing this run
+        journal.reset()
 
     except:
         conn.rollback()
         raise
 
     finally:
+        journal.close()
+        if archive is not None:
+            archive.close()
         conn.close()
         client.close()
 
@@ -16,32 +16,110 @@ import uuid
 import math
 import random
 import base64
-from urllib.parse import quote
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from io import BytesIO
+from urllib.parse import quote, urlparse, urlunparse
 from requests import Session
+from requests.exceptions import RequestException
 import qiniu
 from .auth import get_pwd, get_pgv_pvi, get_pgv_si
 from .cache import MPWXClientCache
-from .utils import u, b, pgz_dump, pgz_load
+from .ratelimit import AIMDController
+from .retry import RetryPolicy, LatencyTracker
+from .transport import Transport
+from .utils import u, b, pgz_dump, pgz_load, chunks
 from .const import CACHE_DIR
 
 qiniu.config.set_default(
     default_zone=qiniu.zone.Zone(home_dir=CACHE_DIR)
 )
 
+# mmbiz.qpic.cn serves an image at these widths when the last path segment
+# of its URL, 0 for the original, is replaced by one of them
+CDN_VARIANT_WIDTHS = (300, 640)
+
+
+def _close_response(f):
+    """ done callback releasing the connection of a response nobody reads """
+    if f.exception() is None:
+        f.result().close()
+
+
+def cover_variant_url(url, width):
+    """ URL of the smallest CDN rendition at least width wide, or url itself """
+
+    u = urlparse(url)
+    head, _, size = u.path.rpartition('/')
+
+    if not u.netloc.endswith("mmbiz.qpic.cn") or not size.isdigit():
+        return url
+
+    for w in CDN_VARIANT_WIDTHS:
+        if w >= width:
+            if size != '0' and width <= int(size) <= w:
+                return url
+            return urlunparse(u._replace(path="%s/%d" % (head, w)))
+
+    # no rendition is wide enough, /0 is the original
+    if size != '0' and int(size) < width:
+        return urlunparse(u._replace(path="%s/0" % head))
+
+    return url
+
+
+def cover_original_url(url):
+    """ URL of the original of a CDN rendition, or url itself """
+
+    u = urlparse(url)
+    head, _, size = u.path.rpartition('/')
+
+    if not u.netloc.endswith("mmbiz.qpic.cn") or not size.isdigit() or size == '0':
+        return url
+
+    return urlunparse(u._replace(path="%s/0" % head))
+
+
 class MPWXClient(object):
 
-    def __init__(self, username, password, timeout=10):
+    # times a throttled request is sent again, each time after the
+    # controller of its host has backed off
+    THROTTLE_RETRIES = 5
+
+    # threads running hedged requests, losers keep theirs until they time out
+    HEDGE_WORKERS = 32
+
+    def __init__(self, username, password, timeout=(5, 10), http_cache=None, rate_limit=None,
+                 retry=None, hedge_percentile=95, hedge_min_samples=20, transport=None):
 
         self._username = username
         self._password = password
         self._timeout = timeout
+        self._http_cache = http_cache
+        self._rate_limit = rate_limit or {}
+        self._controllers = {}
+        self._controllers_lock = threading.Lock()
+        self._retry = retry or RetryPolicy()
+        self._latency = LatencyTracker()
+        self._hedge_percentile = hedge_percentile
+        self._hedge_min_samples = hedge_min_samples
+        self._hedge_executor = ThreadPoolExecutor(max_workers=self.HEDGE_WORKERS)
+        self._stats_lock = threading.Lock()
+
+        self.retried = 0
+        self.hedged = 0
+        self.hedge_wins = 0
 
         self._token = None
 
         cache_key = u(base64.b64encode(b(username)).rstrip(b'='))
         self._cache_file = os.path.join(CACHE_DIR, "%s_session.gz" % cache_key)
 
+        self._transport = transport or Transport()
+
         self._session = Session()
+        self._transport.mount(self._session)
         self._session.headers.update({
             "accept": "*/*",
             "accept-encoding": "gzip, deflate, br",
@@ -77,11 +155,202 @@ class MPWXClient(object):
         pgz_dump(cache, self._cache_file)
 
     def close(self):
+        self._hedge_executor.shutdown(wait=False)
         self._session.close()
+        self._transport.close()
+
+    @property
+    def http_cache(self):
+        return self._http_cache
+
+    @property
+    def rate_controllers(self):
+        """ {host: AIMDController} of the hosts requested so far """
+        with self._controllers_lock:
+            return dict(self._controllers)
+
+    def _controller(self, host):
+        with self._controllers_lock:
+            controller = self._controllers.get(host)
+            if controller is None:
+                controller = AIMDController(**self._rate_limit)
+                self._controllers[host] = controller
+            return controller
+
+    @staticmethod
+    def _is_throttled(r, params):
+
+        if r.status_code == 429:
+            return True
+
+        # JSON APIs answer frequency control with a non-zero base_resp.ret
+        if params is not None and params.get("f") == "json":
+            try:
+                return r.json()['base_resp']['ret'] != 0
+            except (ValueError, KeyError, TypeError):
+                return False
+
+        return False
+
+    def _send_limited(self, send, url, params, **kwargs):
+
+        host = urlparse(url).hostname
+        controller = self._controller(host)
+
+        for _ in range(self.THROTTLE_RETRIES + 1):
+
+            started = controller.acquire()
+
+            # timeouts and connection errors are taken as throttling too
+            try:
+                r = send(**kwargs)
+            except:
+                controller.release(started, throttled=True)
+                raise
+
+            throttled = self._is_throttled(r, params)
+            controller.release(started, throttled)
+
+            if not throttled:
+                break
+
+            print("[MPWX] Throttled by %s, %s" % (host, controller.summary()))
+
+        return r
+
+    @property
+    def transport(self):
+        return self._transport
+
+    @property
+    def latency(self):
+        return self._latency
+
+    def _count(self, name):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _send_timed(self, send, endpoint, **kwargs):
+        t0 = time.monotonic()
+        r = send(**kwargs)
+        if r.status_code < 400:
+            self._latency.add(endpoint, time.monotonic() - t0)
+        return r
+
+    def _send_hedged(self, send, endpoint, url=None, params=None, **kwargs):
+
+        # a duplicate is sent once the request has taken longer than the
+        # hedge_percentile latency of its endpoint, and the first successful
+        # answer wins. For rate limited requests (url given) the duplicate
+        # needs a free slot of the controller of the host, which the request
+        # itself already holds, and is not sent without one
+
+        threshold = None
+
+        if self._hedge_percentile > 0:
+            threshold = self._latency.percentile(endpoint, self._hedge_percentile,
+                                                 self._hedge_min_samples)
+        if threshold is None:
+            return send(**kwargs)
 
-    def _request(self, method, url, params=None, data=None, **kwargs):
+        primary = self._hedge_executor.submit(send, **kwargs)
+
+        done, _ = wait([primary], timeout=threshold)
+        if len(done) > 0:
+            return primary.result()
+
+        controller = None
+
+        if url is not None:
+            controller = self._controller(urlparse(url).hostname)
+            started = controller.try_acquire()
+            if started is None:
+                return primary.result()
+
+        self._count("hedged")
+        backup = self._hedge_executor.submit(send, **kwargs)
+
+        def _is_answer(f):
+            if f.exception() is not None:
+                return False
+            return controller is None or f is not backup \
+                or not self._is_throttled(f.result(), params)
+
+        if controller is not None:
+
+            # the caller gives back the slot of the request as soon as an
+            # answer is returned, the slot of the duplicate is held until
+            # both are done, so that a loser still on the wire is counted
+
+            def _release(_):
+                controller.release(started, throttled=not _is_answer(backup))
+
+            backup.add_done_callback(lambda _: primary.add_done_callback(_release))
+
+        pending = { primary, backup }
+
+        while len(pending) > 0:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                if _is_answer(f):
+                    if f is backup:
+                        self._count("hedge_wins")
+                    for loser in pending:
+                        loser.add_done_callback(_close_response)
+                    return f.result()
+                if f.exception() is None:
+                    f.result().close()
+
+        return primary.result()
+
+    def _send_retried(self, send, url, **kwargs):
+
+        retries = self._retry.retries
+
+        for attempt in range(retries + 1):
+            try:
+                r = send(**kwargs)
+            except RequestException as e:
+                if attempt == retries:
+                    raise
+                print("[MPWX] Retry %s after %s" % (url, e.__class__.__name__))
+            else:
+                if attempt == retries or not self._retry.is_retryable(r):
+                    return r
+                r.close()
+                print("[MPWX] Retry %s after HTTP %d" % (url, r.status_code))
+
+            self._count("retried")
+            time.sleep(self._retry.delay(attempt))
+
+    def _request(self, method, url, params=None, data=None, cache=False, limit=False,
+                 endpoint=None, hedge=False, **kwargs):
         kwargs.setdefault("timeout", self._timeout)
-        return self._session.request(method, url, params=params, data=data, **kwargs)
+
+        def _send(**kwargs):
+            return self._session.request(method, url, params=params, data=data, **kwargs)
+
+        # from the inside out: latency of each request on the wire, hedging,
+        # the rate controller of the host and retries of GETs
+
+        if endpoint is not None:
+            _send = partial(self._send_timed, _send, endpoint)
+            if hedge:
+                _send = partial(self._send_hedged, _send, endpoint,
+                                url if limit else None, params)
+
+        if limit:
+            _send = partial(self._send_limited, _send, url, params)
+
+        if method == 'GET':
+            _send = partial(self._send_retried, _send, url)
+
+        if cache and self._http_cache is not None and method == 'GET' and params is None:
+            headers = kwargs.pop('headers', None)
+            return self._http_cache.request(lambda headers: _send(headers=headers, **kwargs),
+                                            url, headers)
+
+        return _send(**kwargs)
 
     def _get(self, url, params=None, **kwargs):
         return self._request('GET', url, params=params, **kwargs)
@@ -248,7 +517,9 @@ class MPWXClient(object):
                 "lang": "zh_CN",
                 "f": "json",
                 "ajax": "1",
-            }
+            },
+            limit=True,
+            endpoint="newmasssendpage",
         )
         return r
 
@@ -262,34 +533,153 @@ class MPWXClient(object):
                 "sec-fetch-site": "same-origin",
                 "sec-fetch-user": "?1",
                 "upgrade-insecure-requests": "1",
-            }
+            },
+            cache=True,
+            limit=True,
+            endpoint="article_content",
+            hedge=True,
         )
         return r
 
-    def article_cover(self, url):
+    def article_cover(self, url, width=None, stream=False):
+        """ the cover at url, or a smaller rendition still width wide. Streamed
+            responses are not kept in the HTTP cache """
+
+        if width is not None:
+            vurl = cover_variant_url(url, width)
+            if vurl != url:
+                r = self.article_cover(vurl, stream=stream)
+                if r.status_code == 200 and r.headers.get("content-type", "").startswith("image/"):
+                    return r
+                r.close()
+                print("[MPWX] No %dpx rendition of %s" % (width, url))
+
+                # url may itself be a rendition narrower than width
+                url = cover_original_url(url)
+
         r = self._get(
             url=url,
             headers={
                 "Accept": "image/webp,image/apng,image/*,*/*;q=0.8",
-                "Connection": "keep-alive",
-            }
+            },
+            stream=stream,
+            cache=not stream,
+            limit=True,
+            endpoint="article_cover",
+            hedge=True,
         )
         return r
 
 
 class QiniuClient(object):
 
-    def __init__(self, access_key, secret_key, bucket):
+    TOKEN_EXPIRE_MARGIN = 300
+
+    def __init__(self, access_key, secret_key, bucket, token_expires=3600):
         self._auth = qiniu.Auth(access_key, secret_key)
         self._bucket = bucket
+        self._token_expires = token_expires
+        self._tokens = {}
+        self._lock = threading.Lock()
 
     @staticmethod
     def _check_response_info(info):
         if not info.ok():
             raise Exception("QiniuClient ERROR: %s" % info.text_body)
 
+    def _upload_token(self, key):
+
+        # a token scoped to the directory of the key with isPrefixalScope can
+        # upload any new key under it, so it is minted once and reused until
+        # it is about to expire. It cannot overwrite an existing key with
+        # other content, put_data falls back to a token of the key for that
+
+        prefix = key[:key.rfind('/') + 1]
+
+        if prefix == '':
+            return self._auth.upload_token(self._bucket, key)
+
+        with self._lock:
+            token, expired_time = self._tokens.get(prefix, (None, 0))
+
+            if expired_time - self.TOKEN_EXPIRE_MARGIN < int(time.time()):
+                token = self._auth.upload_token(self._bucket, prefix, self._token_expires,
+                                                {"isPrefixalScope": 1})
+                expired_time = int(time.time()) + self._token_expires
+                self._tokens[prefix] = (token, expired_time)
+
+        return token
+
+    # the status of uploads refused because the key exists with other content
+    FILE_EXISTS = 614
+
     def put_data(self, raw, key):
-        token = self._auth.upload_token(self._bucket, key)
+        token = self._upload_token(key)
         ret, info = qiniu.put_data(token, key, raw)
+
+        # covers encoded again replace the old ones, which only "bucket:key"
+        # tokens may do
+        if info.status_code == self.FILE_EXISTS:
+            token = self._auth.upload_token(self._bucket, key)
+            ret, info = qiniu.put_data(token, key, raw)
+
         self._check_response_info(info)
         return ret, info
+
+    @staticmethod
+    def etag(raw):
+        """ the hash Qiniu reports for an object with this content """
+        with BytesIO(raw) as buf:
+            return qiniu.utils.etag_stream(buf)
+
+    def stat_many(self, keys, batch_size=1000):
+        """ {key: hash or None if missing}, one request per batch of keys """
+
+        bucket = qiniu.BucketManager(self._auth)
+        hashes = {}
+
+        for batch in chunks(keys, batch_size):
+            ops = qiniu.build_batch_stat(self._bucket, batch)
+            ret, info = bucket.batch(ops)
+
+            if ret is None:
+                self._check_response_info(info)
+
+            for key, r in zip(batch, ret):
+                hashes[key] = r['data'].get('hash') if r['code'] == 200 else None
+
+        return hashes
+
+    def put_many(self, items, workers=4, callback=None, max_pending=None):
+        """ upload (raw, key) pairs concurrently, returns {key: exception or None} """
+
+        def _put(raw, key):
+            try:
+                self.put_data(raw, key)
+            except Exception as e:
+                return e
+
+        def _done(key, f):
+            try:
+                if callback is not None:
+                    callback(key, f.result())
+            finally:
+                pending.release()
+
+        futures = {}
+
+        # items may be a generator, each upload starts as soon as it is yielded,
+        # and callback(key, exception or None) is called as each one finishes.
+        # Items are only taken from the generator while fewer than max_pending
+        # uploads are waiting or running, so a slow bucket holds back the
+        # producer instead of queueing all of its data in the executor
+        pending = threading.Semaphore(max_pending or workers * 2)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for raw, key in items:
+                pending.acquire()
+                f = executor.submit(_put, raw, key)
+                f.add_done_callback(partial(_done, key))
+                futures[key] = f
+
+        return { key: f.result() for key, f in futures.items() }
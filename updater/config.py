@@ -8,6 +8,7 @@
 # ---------------------------------------
 # Copyright (c) 2020 PKUYouth
 
+import os
 from configparser import RawConfigParser
 from .const import CONFIG_INI
 from .utils import Singleton
@@ -79,3 +80,124 @@ class UpdaterConfig(BaseConfig, metaclass=Singleton):
     @property
     def qiniu_bucket(self):
         return self._config.get('qiniu', 'bucket')
+
+    @property
+    def content_workers(self):
+        return self._config.getint('updater', 'content_workers', fallback=4)
+
+    @property
+    def list_page_size(self):
+        return self._config.getint('updater', 'list_page_size', fallback=7)
+
+    @property
+    def list_workers(self):
+        return self._config.getint('updater', 'list_workers', fallback=4)
+
+    @property
+    def stats_refresh_days(self):
+        return self._config.getint('updater', 'stats_refresh_days', fallback=30)
+
+    @property
+    def stats_scheduler(self):
+        return self._config.getboolean('updater', 'stats_scheduler', fallback=True)
+
+    @property
+    def db_batch_size(self):
+        return self._config.getint('updater', 'db_batch_size', fallback=500)
+
+    @property
+    def static_workers(self):
+        return self._config.getint('updater', 'static_workers', fallback=4)
+
+    @property
+    def image_workers(self):
+        return self._config.getint('updater', 'image_workers', fallback=os.cpu_count())
+
+    @property
+    def pipeline_queue_size(self):
+        return self._config.getint('updater', 'pipeline_queue_size', fallback=64)
+
+    @property
+    def http_cache_size(self):
+        return self._config.getint('updater', 'http_cache_size', fallback=512)
+
+    @property
+    def http_cache_ttl(self):
+        return self._config.getint('updater', 'http_cache_ttl', fallback=86400)
+
+    @property
+    def html_archive(self):
+        return self._config.getboolean('updater', 'html_archive', fallback=True)
+
+    @property
+    def request_rate(self):
+        return self._config.getfloat('updater', 'request_rate', fallback=2.0)
+
+    @property
+    def max_request_rate(self):
+        return self._config.getfloat('updater', 'max_request_rate', fallback=20.0)
+
+    @property
+    def max_request_concurrency(self):
+        return self._config.getint('updater', 'max_request_concurrency', fallback=16)
+
+    @property
+    def connect_timeout(self):
+        return self._config.getfloat('updater', 'connect_timeout', fallback=5.0)
+
+    @property
+    def read_timeout(self):
+        return self._config.getfloat('updater', 'read_timeout', fallback=10.0)
+
+    @property
+    def retries(self):
+        return self._config.getint('updater', 'retries', fallback=3)
+
+    @property
+    def retry_backoff(self):
+        return self._config.getfloat('updater', 'retry_backoff', fallback=0.5)
+
+    @property
+    def hedge_percentile(self):
+        return self._config.getfloat('updater', 'hedge_percentile', fallback=95)
+
+    @property
+    def hedge_min_samples(self):
+        return self._config.getint('updater', 'hedge_min_samples', fallback=20)
+
+    @property
+    def pool_size(self):
+        return self._config.getint('updater', 'pool_size', fallback=16)
+
+    @property
+    def pool_sizes(self):
+        """ {host: pool size} from 'host:size host:size' """
+        pool_sizes = {}
+        for item in self._config.get('updater', 'pool_sizes', fallback='').split():
+            host, size = item.rsplit(':', 1)
+            pool_sizes[host] = int(size)
+        return pool_sizes
+
+    @property
+    def http2(self):
+        return self._config.getboolean('updater', 'http2', fallback=False)
+
+    @property
+    def dns_cache_ttl(self):
+        return self._config.getint('updater', 'dns_cache_ttl', fallback=300)
+
+    @property
+    def cover_max_bytes(self):
+        return self._config.getint('updater', 'cover_max_bytes', fallback=10 * 1024 * 1024)
+
+    @property
+    def cover_max_pixels(self):
+        return self._config.getint('updater', 'cover_max_pixels', fallback=40 * 1000 * 1000)
+
+    @property
+    def cover_formats(self):
+        return self._config.get('updater', 'cover_formats', fallback='jpeg').split()
+
+    @property
+    def cover_cache_size(self):
+        return self._config.getint('updater', 'cover_cache_size', fallback=1024)
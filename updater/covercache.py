@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------------------------
+# Project: PKUYouth Webserver v2
+# File: covercache.py
+# Created Date: 2020-08-03
+# Author: Xinghong Zhong
+# ---------------------------------------
+# Copyright (c) 2020 PKUYouth
+
+import os
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+from ._internal import mkdir
+from .utils import pgz_dump, pgz_load
+
+
+def settings_key(settings, formats):
+    """ digest of the encoder settings and formats covers were made with """
+    return hashlib.sha1(pickle.dumps((sorted(settings.items()), list(formats)))).hexdigest()
+
+
+class CoverCache(object):
+
+    # Downloaded covers and the covers encoded from them, stored once per
+    # content under objects/ and named by their SHA-1, so that articles
+    # sharing a cover share both the file and the encoding. The index maps
+    #
+    #   urls:    (cover URL, width) -> digest of the cover as downloaded for
+    #            that width, the CDN rendition or the original
+    #   encoded: (digest of the original, settings_key) -> [digest of each cover]
+    #   blobs:   digest -> size, least recently used first
+    #
+    # and is dumped with the other state files. Blobs are evicted once their
+    # total size goes over max_size; mappings to evicted blobs are dropped
+    # when they are next looked up.
+
+    def __init__(self, directory, max_size=1024 * 1024 * 1024):
+        self._dir = directory
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._index_file = os.path.join(directory, "index.gz")
+
+        self._urls = {}
+        self._encoded = {}
+        self._blobs = OrderedDict()
+
+        mkdir(os.path.join(directory, "objects/"))
+
+        if os.path.exists(self._index_file):
+            self._urls, self._encoded, self._blobs = pgz_load(self._index_file)
+
+        # indexes written before the width was part of the key
+        self._urls = { key: digest for key, digest in self._urls.items()
+                       if isinstance(key, tuple) }
+
+        # blobs written after the last dump are unknown to the index and
+        # taken as the least recently used, blobs deleted by hand are dropped
+
+        found = {}
+
+        for root, _, names in os.walk(os.path.join(directory, "objects")):
+            for name in names:
+                path = os.path.join(root, name)
+                if name.endswith(".tmp"):
+                    os.remove(path)
+                else:
+                    found[name] = os.path.getsize(path)
+
+        blobs = OrderedDict( (digest, size) for digest, size in found.items()
+                             if digest not in self._blobs )
+        blobs.update( (digest, size) for digest, size in self._blobs.items()
+                      if digest in found )
+
+        self._blobs = blobs
+        self._size = sum(blobs.values())
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def size(self):
+        return self._size
+
+    def _path(self, digest):
+        return os.path.join(self._dir, "objects", digest[:2], digest)
+
+    def _read(self, digest):
+
+        with self._lock:
+            if digest not in self._blobs:
+                return None
+            self._blobs.move_to_end(digest)
+
+        try:
+            with open(self._path(digest), 'rb') as fp:
+                return fp.read()
+        except OSError:
+            with self._lock:
+                self._size -= self._blobs.pop(digest, 0)
+            return None
+
+    def _write(self, data):
+
+        digest = hashlib.sha1(data).hexdigest()
+
+        with self._lock:
+            if digest in self._blobs:
+                self._blobs.move_to_end(digest)
+                return digest
+
+        path = self._path(digest)
+        tmpfile = "%s.%d.tmp" % (path, threading.get_ident())
+
+        mkdir(os.path.dirname(path))
+
+        with open(tmpfile, 'wb') as fp:
+            fp.write(data)
+
+        os.replace(tmpfile, path)
+
+        with self._lock:
+            if digest not in self._blobs:
+                self._blobs[digest] = len(data)
+                self._size += len(data)
+
+            while self._size > self._max_size and len(self._blobs) > 1:
+                old, old_size = self._blobs.popitem(last=False)
+                self._size -= old_size
+                try:
+                    os.remove(self._path(old))
+                except OSError:
+                    pass
+
+        return digest
+
+    def get_original(self, url, width):
+        """ the cover at url as downloaded at least width wide, or None """
+
+        key = (url, width)
+        digest = self._urls.get(key)
+        data = self._read(digest) if digest is not None else None
+
+        with self._lock:
+            if data is None:
+                self._urls.pop(key, None)
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return data
+
+    def put_original(self, url, width, data):
+        digest = self._write(data)
+        with self._lock:
+            self._urls[(url, width)] = digest
+
+    def get_encoded(self, data, skey):
+
+        key = (hashlib.sha1(data).hexdigest(), skey)
+        digests = self._encoded.get(key)
+
+        if digests is None:
+            return None
+
+        covers = [ self._read(digest) for digest in digests ]
+
+        if any( cover is None for cover in covers ):
+            with self._lock:
+                self._encoded.pop(key, None)
+            return None
+
+        return covers
+
+    def put_encoded(self, data, skey, covers):
+        key = (hashlib.sha1(data).hexdigest(), skey)
+        digests = [ self._write(cover) for cover in covers ]
+        with self._lock:
+            self._encoded[key] = digests
+
+    def dump(self):
+        with self._lock:
+            index = (dict(self._urls), dict(self._encoded), OrderedDict(self._blobs))
+        pgz_dump(index, self._index_file)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------------------------
+# Project: PKUYouth Webserver v2
+# File: db.py
+# Created Date: 2020-08-03
+# Author: Xinghong Zhong
+# ---------------------------------------
+# Copyright (c) 2020 PKUYouth
+
+from .utils import chunks
+
+INSERT_ARTICLE_SQL = (
+    'INSERT INTO `article` '
+    '(`appmsgid`,`idx`,`sn`,`title`,`digest`,`content`,`cover_url`,'
+    ' `content_url`,`like_num`,`read_num`,`masssend_time`) '
+    'VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)'
+)
+
+
+def _update_stats_sql(n):
+
+    # a single UPDATE joined against an inline table updates n rows in one
+    # round trip without relying on a unique key over (appmsgid, idx)
+
+    rows = ' UNION ALL '.join(
+        ['SELECT %s AS `appmsgid`, %s AS `idx`, %s AS `like_num`, %s AS `read_num`']
+        + ['SELECT %s,%s,%s,%s'] * (n - 1)
+    )
+
+    return (
+        'UPDATE `article` AS `a` '
+        'JOIN (%s) AS `t` '
+        'ON `a`.`appmsgid` = `t`.`appmsgid` AND `a`.`idx` = `t`.`idx` '
+        'SET `a`.`like_num` = `t`.`like_num`,'
+        '    `a`.`read_num` = `t`.`read_num` ' % rows
+    )
+
+
+def load_article_stats(conn):
+    """ {(appmsgid, idx): (like_num, read_num)} of every stored article """
+
+    sql = 'SELECT `appmsgid`, `idx`, `like_num`, `read_num` FROM `article`'
+
+    with conn.cursor() as cur:
+        cur.execute(sql)
+        return { (str(appmsgid).zfill(10), str(idx)): (like_num, read_num)
+                 for appmsgid, idx, like_num, read_num in cur.fetchall() }
+
+
+def load_max_article_key(conn):
+    """ (appmsgid, idx) of the newest article, scanning the whole table """
+
+    sql = 'SELECT MAX(`appmsgid`) FROM `article` WHERE LENGTH(`appmsgid`) = 10'
+
+    with conn.cursor() as cur:
+        cur.execute(sql)
+        appmsgid = cur.fetchone()[0]
+
+        if appmsgid is None:
+            return '0'.zfill(10), '0'
+
+        sql = 'SELECT MAX(`idx`) FROM `article` WHERE `appmsgid` = %s'
+
+        cur.execute(sql, (appmsgid,))
+        idx = cur.fetchone()[0]
+
+    return appmsgid.zfill(10), str(idx)
+
+
+def insert_articles(conn, rows, batch_size=500):
+    """ rows of INSERT_ARTICLE_SQL parameters, committed per batch """
+
+    inserted = 0
+
+    with conn.cursor() as cur:
+        for batch in chunks(rows, batch_size):
+            inserted += cur.executemany(INSERT_ARTICLE_SQL, batch)
+            conn.commit()
+
+    return inserted
+
+
+def update_article_stats(conn, rows, batch_size=500):
+    """ rows of (appmsgid, idx, like_num, read_num), committed per batch """
+
+    updated = 0
+
+    with conn.cursor() as cur:
+        for batch in chunks(rows, batch_size):
+            data = [ v for row in batch for v in row ]
+            updated += cur.execute(_update_stats_sql(len(batch)), data)
+            conn.commit()
+
+    return updated
+
+
+def update_article_contents(conn, rows, batch_size=500):
+    """ rows of (digest, content, appmsgid, idx), committed per batch """
+
+    sql = 'UPDATE `article` SET `digest` = %s, `content` = %s WHERE `appmsgid` = %s AND `idx` = %s'
+
+    updated = 0
+
+    with conn.cursor() as cur:
+        for batch in chunks(rows, batch_size):
+            updated += cur.executemany(sql, batch)
+            conn.commit()
+
+    return updated
+
+
+def load_article_covers(conn):
+    """ [(appmsgid, idx, cover_url, digest)] of every stored article with content """
+
+    sql = 'SELECT `appmsgid`, `idx`, `cover_url`, `digest` FROM `article` ' \
+          'WHERE `digest` IS NOT NULL'
+
+    with conn.cursor() as cur:
+        cur.execute(sql)
+        return [ (str(appmsgid).zfill(10), str(idx), cover_url, digest)
+                 for appmsgid, idx, cover_url, digest in cur.fetchall() ]
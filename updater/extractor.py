@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------------------------
+# Project: PKUYouth Webserver v2
+# File: extractor.py
+# Created Date: 2020-08-03
+# Author: Xinghong Zhong
+# ---------------------------------------
+# Copyright (c) 2020 PKUYouth
+
+import re
+import html as htmllib
+from lxml import etree
+
+# An article page is mostly inline scripts, styles and templates around the
+# #js_content div. Instead of parsing the whole page, the description is
+# picked out of the <meta> tags of <head> with regexes, and only the slice
+# from <div id="js_content"> to its closing tag, found by counting div tags,
+# goes through the HTML parser. Text nodes are collected as plain strings,
+# lxml's default "smart" strings each keep a reference to their parent.
+# Comments, scripts and styles are stepped over while counting. Pages which
+# declare a charset other than UTF-8, and regions which do not close or hold
+# CDATA, go through the whole-page parse instead.
+
+_META_TAG = re.compile(rb'<meta\b[^>]*>', re.I)
+_ATTR = re.compile(rb'''([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))''')
+_CHARSET = re.compile(rb'charset\s*=\s*([\w-]+)', re.I)
+_JS_CONTENT_TAG = re.compile(rb'''<div\b[^>]*?\sid\s*=\s*["']?js_content["'\s>]''', re.I)
+_DIV_TAG = re.compile(rb'<(?P<slash>/?)div\b', re.I)
+_REGION_TAG = re.compile(rb'<!--.*?(?:-->|\Z)|<(script|style)\b.*?(?:</\1\s*>|\Z)'
+                         rb'|<(?P<slash>/?)div\b', re.I | re.S)
+_SKIPPED = re.compile(rb'<(?:!--|script\b|style\b)', re.I)
+_CDATA = re.compile(rb'<!\[CDATA\[', re.I)
+
+_CONTENT_TEXT = etree.XPath('//div[@id="js_content"][1]//text()', smart_strings=False)
+_TREE_DIGEST = etree.XPath('//head/meta[@name="description"]/@content')
+_TREE_CONTENT_TEXT = etree.XPath('//div[@id="js_content"]//text()')
+
+
+def _attrs(tag):
+    attrs = {}
+    for m in _ATTR.finditer(tag):
+        name = m.group(1).lower()
+        if name not in attrs:
+            value = next(v for v in m.groups()[1:] if v is not None)
+            attrs[name] = value
+    return attrs
+
+
+def _head_meta(html):
+    """ (charset, description) declared by the <meta> tags of <head>, the
+        description as undecoded bytes, either None if missing """
+
+    end = html.find(b'</head>')
+    if end == -1:
+        end = len(html)
+
+    charset = None
+    description = None
+
+    for m in _META_TAG.finditer(html, 0, end):
+        attrs = _attrs(m.group(0))
+
+        if charset is None:
+            if b'charset' in attrs:
+                charset = attrs[b'charset'].lower()
+            elif attrs.get(b'http-equiv', b'').lower() == b'content-type':
+                cm = _CHARSET.search(attrs.get(b'content', b''))
+                if cm is not None:
+                    charset = cm.group(1).lower()
+
+        if description is None and attrs.get(b'name') == b'description' \
+                and b'content' in attrs:
+            description = attrs[b'content']
+
+        if charset is not None and description is not None:
+            break
+
+    return charset, description
+
+
+def extract_digest(html):
+    """ content of <meta name="description"> in <head>, or None """
+
+    _, description = _head_meta(html)
+
+    if description is None:
+        return None
+
+    return htmllib.unescape(description.decode('utf-8', 'replace'))
+
+
+def _region_end(html, begin, tags=_DIV_TAG):
+    """ end of the div opened at begin by counting <div> and </div>, or None
+        if it is never closed. tags may also match comments, scripts and
+        styles, which are stepped over """
+
+    depth = 0
+
+    for m in tags.finditer(html, begin):
+        slash = m.group('slash')
+        if slash is None:
+            continue
+        if slash:
+            depth -= 1
+            if depth == 0:
+                return m.end()
+        else:
+            depth += 1
+
+    return None
+
+
+def extract_article_tree(html):
+    """ (digest, content) of an article page through a parse of the whole
+        page, which follows its charset and copes with any markup """
+
+    tree = etree.HTML(html)
+
+    if tree is None:
+        return None, None
+
+    digest = _TREE_DIGEST(tree)
+
+    if len(digest) == 0:
+        return None, None
+
+    digest = digest[0]
+    content = _TREE_CONTENT_TEXT(tree)
+    content = ' '.join(s.strip() for s in content if len(s) > 0 and not s.isspace())
+
+    return digest, content
+
+
+def extract_content(html):
+    """ text of div#js_content, whitespace-only nodes dropped and the others
+        stripped and joined with spaces, None if the div cannot be cut out
+        of the page """
+
+    m = _JS_CONTENT_TAG.search(html)
+    if m is None:
+        return ''
+
+    begin = m.start()
+    end = _region_end(html, begin)
+
+    # a </div> in a comment, script or style would end the count too early,
+    # they are rare enough in articles to only be looked for afterwards
+    if end is None or _SKIPPED.search(html, begin, end) is not None:
+        end = _region_end(html, begin, _REGION_TAG)
+
+    if end is None:
+        return None
+
+    region = html[begin:end]
+
+    if _CDATA.search(region) is not None:
+        return None
+
+    # parsers must not be shared between threads
+    tree = etree.fromstring(region, etree.HTMLParser(encoding='utf-8'))
+    content = _CONTENT_TEXT(tree)
+
+    return ' '.join(s.strip() for s in content if not s.isspace())
+
+
+def extract_article(html):
+    """ (digest, content) of an article page, (None, None) for pages without
+        a description, which are deleted or blocked articles """
+
+    charset, description = _head_meta(html)
+
+    if charset not in (None, b'utf-8', b'utf8'):
+        return extract_article_tree(html)
+
+    if description is None:
+        return None, None
+
+    content = extract_content(html)
+
+    if content is None:
+        return extract_article_tree(html)
+
+    return htmllib.unescape(description.decode('utf-8', 'replace')), content
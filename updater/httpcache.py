@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------------------------
+# Project: PKUYouth Webserver v2
+# File: httpcache.py
+# Created Date: 2020-08-03
+# Author: Xinghong Zhong
+# ---------------------------------------
+# Copyright (c) 2020 PKUYouth
+
+import os
+import re
+import time
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from ._internal import mkdir
+from .utils import b
+
+# headers worth keeping with a cached body, which is stored already decoded
+_KEPT_HEADERS = ("content-type", "etag", "last-modified", "cache-control", "expires", "date")
+
+
+class HTTPCache(object):
+
+    # One pickled (meta, body) file per URL, named by the URL's SHA-1. The
+    # file mtime is bumped on every hit, so the least recently used entries
+    # are found again after a restart and evicted first once the total size
+    # goes over max_size.
+    #
+    # An entry is served without any request while it is fresh, that is
+    # younger than both the server's max-age/Expires and ttl (which covers
+    # pages like WeChat articles sent with no caching headers at all), and
+    # is revalidated with If-None-Match/If-Modified-Since after that.
+
+    def __init__(self, directory, max_size=512 * 1024 * 1024, ttl=0):
+        self._dir = directory
+        self._max_size = max_size
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._index = OrderedDict()
+        self._size = 0
+
+        mkdir(directory)
+
+        entries = []
+        for name in os.listdir(directory):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(directory, name))
+                continue
+            st = os.stat(os.path.join(directory, name))
+            entries.append((st.st_mtime, name, st.st_size))
+
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self._size += size
+
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    @property
+    def size(self):
+        return self._size
+
+    def _path(self, name):
+        return os.path.join(self._dir, name)
+
+    @staticmethod
+    def _name(url):
+        return hashlib.sha1(b(url)).hexdigest()
+
+    def _load(self, url):
+
+        name = self._name(url)
+        path = self._path(name)
+
+        with self._lock:
+            if name not in self._index:
+                return None
+            self._index.move_to_end(name)
+
+        try:
+            with open(path, 'rb') as fp:
+                meta, body = pickle.load(fp)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self._discard(name)
+            return None
+
+        return meta, body
+
+    def _store(self, url, meta, body):
+
+        name = self._name(url)
+        path = self._path(name)
+        tmpfile = "%s.%d.tmp" % (path, threading.get_ident())
+
+        with open(tmpfile, 'wb') as fp:
+            pickle.dump((meta, body), fp, protocol=pickle.HIGHEST_PROTOCOL)
+
+        size = os.path.getsize(tmpfile)
+        os.replace(tmpfile, path)
+
+        with self._lock:
+            self._size += size - self._index.pop(name, 0)
+            self._index[name] = size
+
+            while self._size > self._max_size and len(self._index) > 1:
+                old, old_size = self._index.popitem(last=False)
+                self._size -= old_size
+                try:
+                    os.remove(self._path(old))
+                except OSError:
+                    pass
+
+    def discard(self, url):
+        """ drop the entry of url, e.g. a page found to be an error page """
+        self._discard(self._name(url))
+
+    def _discard(self, name):
+        with self._lock:
+            self._size -= self._index.pop(name, 0)
+        try:
+            os.remove(self._path(name))
+        except OSError:
+            pass
+
+    def _max_age(self, meta):
+
+        headers = meta['headers']
+        max_age = 0
+
+        m = re.search(r'max-age=(\d+)', headers.get('cache-control', ''))
+
+        if m is not None:
+            max_age = int(m.group(1))
+        elif 'expires' in headers and 'date' in headers:
+            try:
+                expires = parsedate_to_datetime(headers['expires'])
+                date = parsedate_to_datetime(headers['date'])
+                max_age = max(0, int((expires - date).total_seconds()))
+            except (TypeError, ValueError):
+                pass
+
+        return max(max_age, self._ttl)
+
+    @staticmethod
+    def _to_response(url, meta, body):
+        r = Response()
+        r.url = url
+        r.status_code = 200
+        r.reason = "OK"
+        r.headers = CaseInsensitiveDict(meta['headers'])
+        r._content = body
+        r.from_cache = True
+        return r
+
+    def request(self, send, url, headers=None):
+        """ GET url through the cache, send(headers) does the actual request """
+
+        entry = self._load(url)
+        headers = dict(headers or {})
+
+        if entry is not None:
+            meta, body = entry
+
+            if time.time() - meta['stored_at'] < self._max_age(meta):
+                self.hits += 1
+                return self._to_response(url, meta, body)
+
+            if 'etag' in meta['headers']:
+                headers['If-None-Match'] = meta['headers']['etag']
+            if 'last-modified' in meta['headers']:
+                headers['If-Modified-Since'] = meta['headers']['last-modified']
+
+        r = send(headers)
+
+        if r.status_code == 304 and entry is not None:
+            self.revalidated += 1
+            meta['stored_at'] = time.time()
+            self._store(url, meta, body)
+            return self._to_response(url, meta, body)
+
+        self.misses += 1
+
+        if r.status_code == 200:
+            meta = {
+                "stored_at": time.time(),
+                "headers": { k: r.headers[k] for k in _KEPT_HEADERS if k in r.headers },
+            }
+            if self._max_age(meta) > 0 or 'etag' in meta['headers'] \
+                    or 'last-modified' in meta['headers']:
+                self._store(url, meta, r.content)
+
+        return r
@@ -8,12 +8,97 @@
 # ---------------------------------------
 # Copyright (c) 2020 PKUYouth
 
+import math
 from io import BytesIO
-from PIL import Image
+from PIL import Image, ImageFile
+
+try:
+    import pillow_avif  # registers AVIF with Pillow versions before 11.2
+except ImportError:
+    pass
 
 BG_COVER_WIDTH = 540
 SM_COVER_MIN_SIZE = 130
 
+# every cover is encoded at the highest quality in [MIN_QUALITY, MAX_QUALITY]
+# that keeps it within its byte budget, scaled down for the formats which
+# compress better than JPEG
+SM_COVER_MAX_BYTES = 6 * 1024
+BG_COVER_MAX_BYTES = 36 * 1024
+
+MIN_QUALITY = 30
+MAX_QUALITY = 80
+
+FORMAT_BUDGETS = {
+    "jpeg": 1.0,
+    "webp": 0.75,
+    "avif": 0.5,
+}
+
+FORMAT_OPTIONS = {
+    "jpeg": { "progressive": True, "optimize": True },
+    "webp": { "method": 4 },
+    "avif": { "speed": 8 },
+}
+
+# downloads over either budget are aborted
+COVER_MAX_BYTES = 10 * 1024 * 1024
+COVER_MAX_PIXELS = 40 * 1000 * 1000
+
+# covers encoded with different settings are uploaded again
+ENCODER_SETTINGS = {
+    "bg_width": BG_COVER_WIDTH,
+    "sm_min_size": SM_COVER_MIN_SIZE,
+    "sm_max_bytes": SM_COVER_MAX_BYTES,
+    "bg_max_bytes": BG_COVER_MAX_BYTES,
+    "min_quality": MIN_QUALITY,
+    "max_quality": MAX_QUALITY,
+    "format_budgets": FORMAT_BUDGETS,
+    "format_options": FORMAT_OPTIONS,
+}
+
+
+class CoverTooLarge(Exception):
+    pass
+
+
+def read_cover(chunks, length=None, max_bytes=COVER_MAX_BYTES, max_pixels=COVER_MAX_PIXELS):
+    """ bytes of a cover arriving in chunks, checked against both budgets """
+
+    if length is not None and length > max_bytes:
+        raise CoverTooLarge("%d bytes" % length)
+
+    # the parser is only fed until it has read the image header, which is
+    # enough to know the dimensions, the decoding is left to encode_covers
+
+    parser = ImageFile.Parser()
+    buf = bytearray()
+
+    for chunk in chunks:
+        buf += chunk
+
+        if len(buf) > max_bytes:
+            raise CoverTooLarge("more than %d bytes" % max_bytes)
+
+        if parser.image is None:
+
+            # Pillow refuses to open images far past its own pixel limit
+            # before the size can be checked here
+            try:
+                parser.feed(chunk)
+            except Image.DecompressionBombError as e:
+                raise CoverTooLarge(str(e))
+
+            if parser.image is not None:
+                w, h = parser.image.size
+                if w * h > max_pixels:
+                    raise CoverTooLarge("%dx%d pixels" % (w, h))
+
+    if parser.image is None:
+        raise OSError("cannot identify cover image")
+
+    return bytes(buf)
+
 
 def compress_sm_cover(im, min_size=SM_COVER_MIN_SIZE, **kwargs):
 
@@ -44,7 +129,83 @@ def compress_bg_cover(im, width=BG_COVER_WIDTH, **kwargs):
     return im.resize(size=(nw, nh), **kwargs)
 
 
+def open_cover(data, width=BG_COVER_WIDTH, min_size=SM_COVER_MIN_SIZE):
+
+    im = Image.open(BytesIO(data))
+    ow, oh = im.size
+
+    # let the JPEG decoder scale down by 1/2, 1/4 or 1/8 while decoding, as
+    # long as the result is still larger than both covers need
+
+    scale = max(width / ow, min_size / min(ow, oh))
+
+    if scale < 1:
+        im.draft('RGB', (math.ceil(ow * scale), math.ceil(oh * scale)))
+
+    return im.convert('RGB')
+
+
+def make_covers(im, width=BG_COVER_WIDTH, min_size=SM_COVER_MIN_SIZE):
+
+    bim = compress_bg_cover(im, width)
+
+    # the small cover is resampled from the big one unless that would
+    # mean upscaling, e.g. for very wide images
+    src = bim if min(bim.size) >= min_size else im
+
+    sim = compress_sm_cover(src, min_size)
+
+    return sim, bim
+
+
 def im2bytes(im, **kwargs):
     with BytesIO() as buf:
         im.save(buf, **kwargs)
         return buf.getvalue()
+
+
+def available_formats(formats):
+    """ the formats which this Pillow can write """
+    Image.init()
+    return [ fmt for fmt in formats if fmt.upper() in Image.SAVE ]
+
+
+def encode_to_budget(im, format, max_bytes, min_quality=MIN_QUALITY,
+                     max_quality=MAX_QUALITY):
+    """ im encoded at the highest quality within max_bytes, by binary search,
+        or at min_quality if even that is larger """
+
+    options = FORMAT_OPTIONS.get(format, {})
+    best = None
+
+    lo, hi = min_quality, max_quality
+
+    while lo <= hi:
+        quality = (lo + hi) // 2
+        data = im2bytes(im, format=format, quality=quality, **options)
+        if len(data) <= max_bytes:
+            best = data
+            lo = quality + 1
+        else:
+            hi = quality - 1
+
+    if best is None:
+        best = im2bytes(im, format=format, quality=min_quality, **options)
+
+    return best
+
+
+def encode_covers(data, formats=("jpeg",)):
+    """ original cover bytes to [sm_cover, bg_cover] of each format in turn """
+
+    im = open_cover(data)
+    sim, bim = make_covers(im)
+
+    covers = []
+
+    for fmt in formats:
+        budget = FORMAT_BUDGETS.get(fmt, 1.0)
+        covers.append(encode_to_budget(sim, fmt, int(SM_COVER_MAX_BYTES * budget)))
+        covers.append(encode_to_budget(bim, fmt, int(BG_COVER_MAX_BYTES * budget)))
+
+    return covers
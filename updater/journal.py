@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------------------------
+# Project: PKUYouth Webserver v2
+# File: journal.py
+# Created Date: 2020-08-03
+# Author: Xinghong Zhong
+# ---------------------------------------
+# Copyright (c) 2020 PKUYouth
+
+import os
+import threading
+
+STAGE_LIST = "list"
+STAGE_CONTENT = "content"
+STAGE_DATABASE = "database"
+STAGE_STATIC = "static"
+
+# appmsgid/idx of entries which are about the whole run
+RUN = "*"
+
+
+class ProgressJournal(object):
+
+    # One "appmsgid idx stage" line is appended and flushed for every stage
+    # an article completes, so a crash loses at most the line being written.
+    # Once there are more than twice as many lines as articles, the file is
+    # rewritten with one "appmsgid idx stage,stage,..." line per article.
+
+    COMPACT_MIN_LINES = 1000
+
+    def __init__(self, file):
+        self._file = file
+        self._done = {}
+        self._entries = 0
+        self._lines = 0
+        self._lock = threading.Lock()
+
+        if os.path.exists(file):
+            with open(file, 'r', encoding='utf-8') as fp:
+                for line in fp:
+                    entry = line.split()
+                    if len(entry) != 3 or not line.endswith("\n"):
+                        continue  # torn last line
+                    appmsgid, idx, stages = entry
+                    for stage in stages.split(','):
+                        self._add(appmsgid, idx, stage)
+                    self._lines += 1
+
+        self._fp = open(file, 'a', encoding='utf-8')
+        self._maybe_compact()
+
+    def __len__(self):
+        return self._entries
+
+    @property
+    def lines(self):
+        return self._lines
+
+    def _add(self, appmsgid, idx, stage):
+        stages = self._done.setdefault((appmsgid, idx), set())
+        if stage in stages:
+            return False
+        stages.add(stage)
+        self._entries += 1
+        return True
+
+    def is_done(self, appmsgid, idx, stage):
+        return stage in self._done.get((appmsgid, str(idx)), ())
+
+    def mark(self, appmsgid, idx, stage):
+        with self._lock:
+            if not self._add(appmsgid, str(idx), stage):
+                return
+            self._fp.write("%s %s %s\n" % (appmsgid, idx, stage))
+            self._fp.flush()
+            self._lines += 1
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        if self._lines > max(self.COMPACT_MIN_LINES, 2 * len(self._done)):
+            self._compact()
+
+    def _compact(self):
+        tmpfile = self._file + ".tmp"
+
+        with open(tmpfile, 'w', encoding='utf-8') as fp:
+            for (appmsgid, idx), stages in sorted(self._done.items()):
+                fp.write("%s %s %s\n" % (appmsgid, idx, ','.join(sorted(stages))))
+
+        self._fp.close()
+        os.replace(tmpfile, self._file)
+
+        self._fp = open(self._file, 'a', encoding='utf-8')
+        self._lines = len(self._done)
+
+    def reset(self):
+        with self._lock:
+            self._fp.close()
+            self._fp = open(self._file, 'w', encoding='utf-8')
+            self._done.clear()
+            self._entries = 0
+            self._lines = 0
+
+    def close(self):
+        self._fp.close()
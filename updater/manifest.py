@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------------------------
+# Project: PKUYouth Webserver v2
+# File: manifest.py
+# Created Date: 2020-08-03
+# Author: Xinghong Zhong
+# ---------------------------------------
+# Copyright (c) 2020 PKUYouth
+
+import os
+import time
+from .utils import pgz_dump, pgz_load
+
+class UploadManifest(object):
+
+    def __init__(self, file):
+        self._file = file
+        self._entries = {}
+
+        if os.path.exists(file):
+            self._entries = pgz_load(file)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def keys(self):
+        return list(self._entries.keys())
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def is_fresh(self, key, source_url, settings):
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        return entry['source_url'] == source_url and entry['settings'] == settings
+
+    def add(self, key, source_url, hash, settings):
+        self._entries[key] = {
+            "source_url": source_url,
+            "hash": hash,
+            "settings": settings,
+            "uploaded_at": int(time.time()),
+        }
+
+    def remove(self, key):
+        self._entries.pop(key, None)
+
+    def dump(self):
+        pgz_dump(self._entries, self._file)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------------------------
+# Project: PKUYouth Webserver v2
+# File: pipeline.py
+# Created Date: 2020-08-03
+# Author: Xinghong Zhong
+# ---------------------------------------
+# Copyright (c) 2020 PKUYouth
+
+import queue
+import threading
+
+_END = object()
+
+
+class PipelineAborted(Exception):
+    pass
+
+
+class Pipeline(object):
+
+    # Stages run in their own threads and talk through bounded queues. When
+    # a stage fails, every blocked put/get raises PipelineAborted so that
+    # the other stages unwind instead of waiting on each other forever.
+
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, maxsize=64):
+        self._maxsize = maxsize
+        self._abort = threading.Event()
+        self._threads = []
+        self._errors = []
+
+    def queue(self):
+        return queue.Queue(self._maxsize)
+
+    def put(self, q, item):
+        while True:
+            if self._abort.is_set():
+                raise PipelineAborted()
+            try:
+                q.put(item, timeout=self.POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def iterate(self, q):
+        while True:
+            if self._abort.is_set():
+                raise PipelineAborted()
+            try:
+                item = q.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if item is _END:
+                return
+            yield item
+
+    def stage(self, name, func, outputs=()):
+        """ run func in a thread, closing the output queues when it returns """
+
+        def _run():
+            try:
+                func()
+            except PipelineAborted:
+                pass
+            except BaseException as e:
+                self._errors.append((name, e))
+                self._abort.set()
+            finally:
+                for q in outputs:
+                    try:
+                        self.put(q, _END)
+                    except PipelineAborted:
+                        pass
+
+        self._threads.append(threading.Thread(target=_run, name=name, daemon=True))
+
+    def run(self):
+
+        for t in self._threads:
+            t.start()
+
+        for t in self._threads:
+            t.join()
+
+        if len(self._errors) > 0:
+            name, e = self._errors[0]
+            print("[PIPELINE] Stage %s failed" % name)
+            raise e
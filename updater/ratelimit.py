@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------------------------
+# Project: PKUYouth Webserver v2
+# File: ratelimit.py
+# Created Date: 2020-08-03
+# Author: Xinghong Zhong
+# ---------------------------------------
+# Copyright (c) 2020 PKUYouth
+
+import time
+import threading
+
+
+class AIMDController(object):
+
+    # Caps both the number of requests in flight and the rate at which they
+    # start. Healthy responses grow the rate by `increase` requests/s every
+    # second and the concurrency limit by one every limit responses; a
+    # throttled response multiplies both by `decrease`. Only requests started
+    # after the last cut can cut again, so one burst of throttled responses
+    # to requests already in flight counts once, as in TCP congestion control.
+
+    def __init__(self, rate=2.0, max_rate=20.0, min_rate=0.1, concurrency=2,
+                 max_concurrency=16, increase=1.0, decrease=0.5):
+        self._rate = rate
+        self._max_rate = max_rate
+        self._min_rate = min_rate
+        self._limit = float(concurrency)
+        self._max_concurrency = max_concurrency
+        self._increase = increase
+        self._decrease = decrease
+        self._cond = threading.Condition()
+        self._inflight = 0
+        self._next_at = 0.0
+        self._cut_at = 0.0
+
+        self.throttled = 0
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    def acquire(self):
+        """ block until a request may start, returns its start time """
+
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._inflight < int(self._limit) and now >= self._next_at:
+                    break
+                timeout = self._next_at - now if now < self._next_at else None
+                self._cond.wait(timeout)
+
+            self._inflight += 1
+            self._next_at = now + 1 / self._rate
+
+        return now
+
+    def try_acquire(self):
+        """ start time of a request if one may start now, else None """
+
+        with self._cond:
+            now = time.monotonic()
+            if self._inflight >= int(self._limit) or now < self._next_at:
+                return None
+
+            self._inflight += 1
+            self._next_at = now + 1 / self._rate
+
+        return now
+
+    def release(self, started, throttled=False):
+
+        with self._cond:
+            self._inflight -= 1
+
+            if not throttled:
+                self._rate = min(self._max_rate, self._rate + self._increase / self._rate)
+                self._limit = min(self._max_concurrency, self._limit + 1 / self._limit)
+
+            else:
+                self.throttled += 1
+
+                if started >= self._cut_at:
+                    now = time.monotonic()
+                    self._rate = max(self._min_rate, self._rate * self._decrease)
+                    self._limit = max(1.0, self._limit * self._decrease)
+                    self._next_at = now + 1 / self._rate
+                    self._cut_at = now
+
+            self._cond.notify_all()
+
+    def summary(self):
+        return "%.2f req/s, %d concurrent, %d throttled" % (self._rate, self.limit,
+                                                           self.throttled)
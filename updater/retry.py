@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------------------------
+# Project: PKUYouth Webserver v2
+# File: retry.py
+# Created Date: 2020-08-03
+# Author: Xinghong Zhong
+# ---------------------------------------
+# Copyright (c) 2020 PKUYouth
+
+import random
+import threading
+from collections import deque
+
+
+class RetryPolicy(object):
+
+    # Exponential backoff with full jitter: before retry n the caller sleeps
+    # a random time in [0, min(max_backoff, backoff * 2 ** n)), which spreads
+    # out the retries of requests that failed together.
+
+    def __init__(self, retries=3, backoff=0.5, max_backoff=30.0):
+        self.retries = retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self._max_backoff, self._backoff * 2 ** attempt))
+
+    @staticmethod
+    def is_retryable(r):
+        return r.status_code >= 500
+
+
+class LatencyTracker(object):
+
+    # the latencies of the last `window` successful requests of each endpoint
+
+    def __init__(self, window=200):
+        self._window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, latency):
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if samples is None:
+                samples = self._samples[endpoint] = deque(maxlen=self._window)
+            samples.append(latency)
+
+    def percentile(self, endpoint, p, min_samples=1):
+        """ p-th percentile latency of endpoint, None if too few samples """
+
+        with self._lock:
+            samples = sorted(self._samples.get(endpoint, ()))
+
+        if len(samples) < max(1, min_samples):
+            return None
+
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+    def summary(self, endpoint):
+        p50 = self.percentile(endpoint, 50)
+        if p50 is None:
+            return "no samples"
+        return "p50 %.2fs, p95 %.2fs, p99 %.2fs" % (
+            p50, self.percentile(endpoint, 95), self.percentile(endpoint, 99))
+
+    def endpoints(self):
+        with self._lock:
+            return list(self._samples.keys())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------------------------
+# Project: PKUYouth Webserver v2
+# File: schedule.py
+# Created Date: 2020-08-03
+# Author: Xinghong Zhong
+# ---------------------------------------
+# Copyright (c) 2020 PKUYouth
+
+import os
+import time
+from .utils import pgz_dump, pgz_load
+
+TIER_HOT = 0
+TIER_WARM = 1
+TIER_COLD = 2
+
+TIER_NAMES = ("hot", "warm", "cold")
+
+# minimum seconds between two refreshes of an article in each tier
+TIER_INTERVALS = (0, 86400, 30 * 86400)
+
+WARM_AGE = 7 * 86400
+COLD_AGE = 90 * 86400
+
+# articles whose reads grow slower than this are moved one tier colder
+SLOW_READS_PER_DAY = 5
+
+
+# For every article seen it keeps the last known counters, the read growth
+# rate between the last two refreshes, and its position counted from the
+# oldest message (rposition), which stays stable while new messages are
+# sent and is used to locate the newmasssendpage page holding it.
+
+class StatsScheduler(object):
+
+    def __init__(self, file):
+        self._file = file
+        self._snapshots = {}
+
+        if os.path.exists(file):
+            self._snapshots = pgz_load(file)
+
+    def __len__(self):
+        return len(self._snapshots)
+
+    def dump(self):
+        pgz_dump(self._snapshots, self._file)
+
+    def tier(self, key, now=None):
+
+        if now is None:
+            now = int(time.time())
+
+        s = self._snapshots[key]
+        age = now - s['masssend_time']
+
+        if age < WARM_AGE:
+            tier = TIER_HOT
+        elif age < COLD_AGE:
+            tier = TIER_WARM
+        else:
+            tier = TIER_COLD
+
+        if s['read_rate'] is not None and s['read_rate'] < SLOW_READS_PER_DAY:
+            tier = min(tier + 1, TIER_COLD)
+
+        return tier
+
+    def is_due(self, key, now=None):
+
+        if now is None:
+            now = int(time.time())
+
+        s = self._snapshots[key]
+        return now - s['refreshed_at'] >= TIER_INTERVALS[self.tier(key, now)]
+
+    def due_pages(self, total, count, now=None):
+        """ begin offsets of the newmasssendpage pages holding due articles """
+
+        if now is None:
+            now = int(time.time())
+
+        begins = set()
+
+        for key, s in self._snapshots.items():
+            if not self.is_due(key, now):
+                continue
+            position = total - 1 - s['rposition']
+            if position < 0:
+                continue
+            begins.add(position // count * count)
+
+        return sorted(begins)
+
+    def update(self, ad, rposition, now=None):
+
+        if now is None:
+            now = int(time.time())
+
+        key = ad.key
+        s = self._snapshots.get(key)
+
+        read_rate = None
+
+        if s is not None:
+            read_rate = s['read_rate']
+            dt = now - s['refreshed_at']
+            if dt > 0:
+                read_rate = (ad.read_num - s['read_num']) / dt * 86400
+
+        self._snapshots[key] = {
+            "rposition": rposition,
+            "masssend_time": ad.masssend_time,
+            "refreshed_at": now,
+            "like_num": ad.like_num,
+            "read_num": ad.read_num,
+            "read_rate": read_rate,
+        }
+
+    def summary(self, now=None):
+
+        if now is None:
+            now = int(time.time())
+
+        tiers = [0] * len(TIER_NAMES)
+        due = 0
+
+        for key in self._snapshots:
+            tiers[self.tier(key, now)] += 1
+            if self.is_due(key, now):
+                due += 1
+
+        return ', '.join("%s %d" % (name, n) for name, n in zip(TIER_NAMES, tiers)) \
+                + ', due %d' % due
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------------------------
+# Project: PKUYouth Webserver v2
+# File: state.py
+# Created Date: 2020-08-03
+# Author: Xinghong Zhong
+# ---------------------------------------
+# Copyright (c) 2020 PKUYouth
+
+import os
+import time
+from .utils import pgz_dump, pgz_load
+
+class SyncState(object):
+
+    def __init__(self, file):
+        self._file = file
+        self._state = {}
+
+        if os.path.exists(file):
+            self._state = pgz_load(file)
+
+    @property
+    def appmsgid(self):
+        return self._state.get('appmsgid')
+
+    @property
+    def idx(self):
+        return self._state.get('idx')
+
+    @property
+    def synced_at(self):
+        return self._state.get('synced_at')
+
+    @property
+    def started_at(self):
+        return self._state.get('started_at')
+
+    @property
+    def finished_at(self):
+        return self._state.get('finished_at')
+
+    def set_watermark(self, appmsgid, idx):
+        self._state['appmsgid'] = appmsgid
+        self._state['idx'] = idx
+        self._state['synced_at'] = int(time.time())
+
+    def begin_run(self):
+        self._state['started_at'] = int(time.time())
+
+    def finish_run(self):
+        self._state['finished_at'] = int(time.time())
+
+    def dump(self):
+        pgz_dump(self._state, self._file)
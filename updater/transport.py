@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------------------------
+# Project: PKUYouth Webserver v2
+# File: transport.py
+# Created Date: 2020-08-03
+# Author: Xinghong Zhong
+# ---------------------------------------
+# Copyright (c) 2020 PKUYouth
+
+import time
+import socket
+import threading
+from http.client import HTTPMessage
+from requests import Response
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from requests.exceptions import ConnectTimeout, ReadTimeout, ConnectionError
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError, ConnectTimeoutError
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+class DNSCache(object):
+
+    # getaddrinfo results kept for ttl seconds, used by the connections of
+    # the adapters of one Transport only, the rest of the process resolves
+    # names as usual
+
+    def __init__(self, ttl=300):
+        self._ttl = ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, host, port):
+        """ addresses to connect to for host:port, in getaddrinfo order """
+
+        key = (host, port)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+
+        infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+
+        addresses = []
+        for _, _, _, _, sockaddr in infos:
+            if sockaddr[0] not in addresses:
+                addresses.append(sockaddr[0])
+
+        with self._lock:
+            self._cache[key] = (now + self._ttl, addresses)
+            self.misses += 1
+
+        return addresses
+
+
+class _CachedDNSConnection(object):
+
+    # mixed into the urllib3 connection classes: each address of the host is
+    # tried in turn, the host name itself is still used for SNI and
+    # certificate checks
+
+    dns = None
+
+    def _new_conn(self):
+
+        host = self._dns_host
+        error = None
+
+        for address in self.dns.resolve(host, self.port):
+            self._dns_host = address
+            try:
+                return super()._new_conn()
+            except (NewConnectionError, ConnectTimeoutError) as e:
+                error = e
+            finally:
+                self._dns_host = host
+
+        raise error
+
+
+class CachedDNSAdapter(HTTPAdapter):
+
+    # an HTTPAdapter whose connections resolve host names through dns
+
+    def __init__(self, dns, **kwargs):
+        self._dns = dns
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+
+        attrs = { "dns": self._dns }
+
+        http_conn = type("HTTPConnection", (_CachedDNSConnection, HTTPConnection), attrs)
+        https_conn = type("HTTPSConnection", (_CachedDNSConnection, HTTPSConnection), attrs)
+
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": type("HTTPConnectionPool", (HTTPConnectionPool,),
+                         { "ConnectionCls": http_conn }),
+            "https": type("HTTPSConnectionPool", (HTTPSConnectionPool,),
+                          { "ConnectionCls": https_conn }),
+        }
+
+
+class _HTTPXRaw(object):
+
+    # what requests expects of Response.raw: stream() for iter_content, and
+    # _original_response.msg for the cookies of the session
+
+    def __init__(self, r):
+        self._r = r
+        self._original_response = self
+        self.msg = HTTPMessage()
+        for k, v in r.headers.multi_items():
+            self.msg[k] = v
+
+    def stream(self, chunk_size=None, decode_content=True):
+        try:
+            yield from self._r.iter_bytes(chunk_size)
+        except httpx.TimeoutException as e:
+            raise ReadTimeout(e)
+        except httpx.TransportError as e:
+            raise ConnectionError(e)
+        finally:
+            self._r.close()
+
+    def read(self, amt=None):
+        return b''.join(self.stream())
+
+    def close(self):
+        self._r.close()
+
+    def release_conn(self):
+        self._r.close()
+
+
+class HTTP2Adapter(BaseAdapter):
+
+    # Sends the requests of a requests.Session over httpx, multiplexed on
+    # HTTP/2 connections where the server supports it. Cookies, redirects
+    # and headers are still handled by the session.
+
+    def __init__(self, max_connections=16, verify=True):
+        super().__init__()
+        self._transport = httpx.HTTPTransport(
+            http2=True,
+            verify=verify,
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections),
+        )
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.http2_requests = 0
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+        else:
+            connect = read = timeout
+
+        req = httpx.Request(
+            request.method,
+            request.url,
+            headers=list(request.headers.items()),
+            content=request.body,
+            extensions={
+                "timeout": { "connect": connect, "read": read, "write": read, "pool": read },
+            },
+        )
+
+        try:
+            r = self._transport.handle_request(req)
+        except httpx.ConnectTimeout as e:
+            raise ConnectTimeout(e, request=request)
+        except httpx.TimeoutException as e:
+            raise ReadTimeout(e, request=request)
+        except httpx.TransportError as e:
+            raise ConnectionError(e, request=request)
+
+        with self._lock:
+            self.requests += 1
+            if r.extensions.get("http_version") == b"HTTP/2":
+                self.http2_requests += 1
+
+        resp = Response()
+        resp.status_code = r.status_code
+        resp.reason = r.reason_phrase
+        resp.headers = CaseInsensitiveDict(r.headers)
+        resp.encoding = get_encoding_from_headers(resp.headers)
+        resp.raw = _HTTPXRaw(r)
+        resp.url = request.url
+        resp.request = request
+        resp.connection = self
+
+        return resp
+
+    def close(self):
+        self._transport.close()
+
+
+class Transport(object):
+
+    # The adapters of the session shared by all MPWXClient endpoints: one
+    # per host listed in pool_sizes, sized accordingly, and a default one of
+    # pool_size connections per host for the others. With http2 (which needs
+    # httpx[http2]) https hosts are served by HTTP2Adapter. DNS results are
+    # cached for the HTTP/1.1 adapters, HTTP/2 keeps few long-lived
+    # connections which rarely resolve again.
+
+    def __init__(self, pool_size=16, pool_sizes=None, http2=False, dns_ttl=300):
+        self._pool_size = pool_size
+        self._pool_sizes = pool_sizes or {}
+        self._http2 = http2
+        self._adapters = []
+        self._dns = None
+
+        if http2 and httpx is None:
+            print("[HTTP] httpx is not installed, fall back to HTTP/1.1")
+            self._http2 = False
+
+        if dns_ttl > 0:
+            self._dns = DNSCache(dns_ttl)
+
+    def _adapter(self, scheme, pool_size):
+        if scheme == "https" and self._http2:
+            adapter = HTTP2Adapter(pool_size)
+        elif self._dns is not None:
+            adapter = CachedDNSAdapter(self._dns, pool_connections=10, pool_maxsize=pool_size)
+        else:
+            adapter = HTTPAdapter(pool_connections=10, pool_maxsize=pool_size)
+        self._adapters.append((scheme, adapter))
+        return adapter
+
+    def mount(self, session):
+
+        for scheme in ("http", "https"):
+            session.mount("%s://" % scheme, self._adapter(scheme, self._pool_size))
+
+            for host, pool_size in self._pool_sizes.items():
+                session.mount("%s://%s/" % (scheme, host), self._adapter(scheme, pool_size))
+
+    def summary(self):
+        """ connection reuse of every host requested so far """
+
+        lines = []
+
+        for scheme, adapter in self._adapters:
+
+            if isinstance(adapter, HTTP2Adapter):
+                if adapter.requests > 0:
+                    lines.append("%s:// %d requests, %d over HTTP/2"
+                                    % (scheme, adapter.requests, adapter.http2_requests))
+                continue
+
+            pools = adapter.poolmanager.pools
+
+            for key in pools.keys():
+                pool = pools[key]
+                if pool.num_requests == 0:
+                    continue
+                lines.append("%s://%s %d requests over %d connections (%.0f%% reused)"
+                                % (scheme, pool.host, pool.num_requests, pool.num_connections,
+                                   100 * (1 - pool.num_connections / pool.num_requests)))
+
+        if self._dns is not None:
+            lines.append("DNS cache %d hits, %d misses" % (self._dns.hits, self._dns.misses))
+
+        return lines
+
+    def close(self):
+        for _, adapter in self._adapters:
+            adapter.close()
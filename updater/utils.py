@@ -11,12 +11,24 @@
 import gzip
 import pickle
 import hashlib
+from itertools import islice
+from collections import deque
 
 try:
     import simplejson as json
 except ImportError:
     import json
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
 from ._internal import mkdir
 
 
@@ -55,6 +67,71 @@ def jgz_load(file):
     with gzip.open(file, 'rt') as fp:
         return json.load(fp)
 
+JL_CODECS = [ codec for codec, module in [
+    ("zstd", zstandard),
+    ("lz4", lz4),
+    ("gzip", gzip),
+] if module is not None ]
+
+_JL_MAGICS = [
+    (b'\x28\xb5\x2f\xfd', "zstd"),
+    (b'\x04\x22\x4d\x18', "lz4"),
+    (b'\x1f\x8b', "gzip"),
+]
+
+def _jl_open(file, mode, codec=None):
+    """ text stream over a zstd/lz4/gzip compressed file """
+    if 'r' in mode:
+        with open(file, 'rb') as fp:
+            magic = fp.read(4)
+        codec = next(( c for m, c in _JL_MAGICS if magic.startswith(m) ), None)
+        if codec not in JL_CODECS:
+            raise ValueError("unsupported codec of %s" % file)
+    elif codec is None:
+        codec = JL_CODECS[0]
+    if codec == "zstd":
+        return zstandard.open(file, mode, encoding='utf-8')
+    if codec == "lz4":
+        return lz4.frame.open(file, mode, encoding='utf-8')
+    return gzip.open(file, mode, compresslevel=6, encoding='utf-8')
+
+def jl_dump(iterable, file, codec=None):
+    """ write objects as compressed JSON lines, returns the number written """
+    n = 0
+    with _jl_open(file, 'wt', codec) as fp:
+        for obj in iterable:
+            fp.write(json.dumps(obj, ensure_ascii=False))
+            fp.write('\n')
+            n += 1
+    return n
+
+def jl_iter(file):
+    """ read back what jl_dump wrote, one object at a time """
+    with _jl_open(file, 'rt') as fp:
+        for line in fp:
+            yield json.loads(line)
+
+def chunks(iterable, n):
+    """ split an iterable into lists of at most n items """
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, n))
+        if len(batch) == 0:
+            return
+        yield batch
+
+def imap_ordered(executor, func, iterable, window):
+    """ executor.map yielding (item, result) with at most window calls in flight """
+    pending = deque()
+    for item in iterable:
+        pending.append((item, executor.submit(func, item)))
+        if len(pending) >= window:
+            item, f = pending.popleft()
+            yield item, f.result()
+    while len(pending) > 0:
+        item, f = pending.popleft()
+        yield item, f.result()
+
 class Singleton(type):
 
     _inst = {}